@@ -0,0 +1,51 @@
+from ozone.analysis import binning
+from timeit import timeit
+
+import numpy as np
+
+
+def binning_masks(
+    xdata, ydata, xerr, yerr, n_bins=200, core_percentile=(50, 50), min_bin_points=10
+):
+    bins = np.quantile(xdata, np.linspace(0, 1, n_bins + 1))
+    indices = np.digitize(xdata, bins)
+    out = ([], [], [], [])
+    for i in range(1, len(bins)):
+        m = indices == i
+        if np.sum(m) < min_bin_points:
+            continue
+        lo = np.percentile(ydata[m], core_percentile[0])
+        hi = np.percentile(ydata[m], core_percentile[1])
+        core = m & (ydata >= lo) & (ydata <= hi)
+        N = np.count_nonzero(core)
+        if N == 0:
+            continue
+        x_bin, y_bin = xdata[core], ydata[core]
+        x_meas = np.sqrt(np.sum(xerr[core] ** 2)) / N
+        y_meas = np.sqrt(np.sum(yerr[core] ** 2)) / N
+        x_scatter = np.std(x_bin) / np.sqrt(N)
+        y_scatter = np.std(y_bin) / np.sqrt(N)
+        out[0].append(np.median(x_bin))
+        out[1].append(np.median(y_bin))
+        out[2].append(np.sqrt(x_meas**2 + x_scatter**2))
+        out[3].append(np.sqrt(y_meas**2 + y_scatter**2))
+    return tuple(np.array(v) for v in out)
+
+
+# N2O and O3 pairs of one and several winters of MLS profiles
+rng = np.random.default_rng(42)
+for npoints in (100_000, 1_000_000):
+    n2o = rng.uniform(0, 300, npoints)
+    o3 = 3 + 0.01 * n2o + rng.normal(0, 0.3, npoints)
+    n2o_err = rng.uniform(5, 20, npoints)
+    o3_err = rng.uniform(0.05, 0.2, npoints)
+    args = (n2o, o3, n2o_err, o3_err)
+    kwargs = dict(core_percentile=(25, 75))
+
+    for a, b in zip(binning_masks(*args, **kwargs), binning(*args, **kwargs)):
+        assert np.array_equal(a, b)
+    tmask = timeit(lambda: binning_masks(*args, **kwargs), number=1)
+    tsort = timeit(lambda: binning(*args, **kwargs), number=1)
+    line = f"points: {npoints:8d}  masks: {tmask * 1e3:8.1f} ms  "
+    line += f"sorted: {tsort * 1e3:8.1f} ms  speedup: {tmask / tsort:6.1f}x"
+    print(line)
@@ -0,0 +1,39 @@
+from ozone.analysis import interp_linear
+from scipy.interpolate import interp1d
+from timeit import timeit
+
+import numpy as np
+
+
+def interp_loop(xsource, values, xtarget):
+    return np.array(
+        [
+            interp1d(
+                xsource, row, kind="linear", bounds_error=False, fill_value=np.nan
+            )(xtarget)
+            for row in values
+        ]
+    )
+
+
+# MLS profiles on their 55 level grid, in hPa and float32 like the
+# granules, interpolated to the 41 levels of MIRA2, in Pa
+rng = np.random.default_rng(42)
+psource = (1000 * 10 ** (-np.arange(55) / 12)).astype(np.float32)
+ptarget = np.logspace(np.log10(2e4), np.log10(5), 41)
+xsource = np.log(psource * 1e2)
+xtarget = np.log(ptarget)
+
+for nprof in (1500, 15000):
+    values = rng.normal(5e-6, 1e-6, (nprof, 55)).astype(np.float32)
+    values[rng.random(values.shape) < 0.05] = np.nan
+    assert np.array_equal(
+        interp_linear(xsource, values, xtarget),
+        interp_loop(xsource, values, xtarget),
+        equal_nan=True,
+    )
+    tloop = timeit(lambda: interp_loop(xsource, values, xtarget), number=1)
+    tvec = timeit(lambda: interp_linear(xsource, values, xtarget), number=1)
+    line = f"profiles: {nprof:6d}  interp1d: {tloop * 1e3:8.1f} ms  "
+    line += f"batched: {tvec * 1e3:8.1f} ms  speedup: {tloop / tvec:8.1f}x"
+    print(line)
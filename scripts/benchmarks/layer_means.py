@@ -0,0 +1,61 @@
+from ozone.analysis import (
+    make_weighted_mean,
+    propagate_uncertainty_mira2,
+    propagate_uncertainty_mls,
+    pressure_region_weights,
+)
+from timeit import timeit
+
+import numpy as np
+
+
+def mean_loop(data, pmax, pmin):
+    means = []
+    for v in data.values():
+        w = pressure_region_weights(p=v["pgrid"], pmax=pmax, pmin=pmin)
+        means.append(w @ v["x_phys"])
+    return np.array(means)
+
+
+def mira2_loop(data, pmax, pmin):
+    variances = []
+    for v in data.values():
+        w = pressure_region_weights(p=v["pgrid"], pmax=pmax, pmin=pmin)
+        variances.append(w.T @ v["S_phys"] @ w)
+    return np.array(variances)
+
+
+def mls_loop(data, pmax, pmin):
+    variances = []
+    for v in data.values():
+        w = pressure_region_weights(p=v["p_interp"], pmax=pmax, pmin=pmin)
+        variances.append(w.T @ np.diag((v["precision_interp"] * 1e6) ** 2) @ w)
+    return np.array(variances)
+
+
+# a winter of screened MIRA2 retrievals and matched MLS profiles on
+# the 41 level MIRA2 grid, in Pa
+rng = np.random.default_rng(42)
+pgrid = np.logspace(np.log10(2e4), np.log10(5), 41)
+nprof = 2000
+mira2 = {}
+mls = {}
+for i in range(nprof):
+    S = rng.normal(0, 1e-1, (41, 41))
+    mira2[i] = {"pgrid": pgrid, "x_phys": rng.normal(5, 1, 41), "S_phys": S @ S.T}
+    mls[i] = {"p_interp": pgrid, "precision_interp": rng.uniform(0, 1e-6, 41)}
+
+pmax, pmin = 5000, 1000
+cases = [
+    ("mean", mean_loop, make_weighted_mean, mira2),
+    ("MIRA2 variance", mira2_loop, propagate_uncertainty_mira2, mira2),
+    ("MLS variance", mls_loop, propagate_uncertainty_mls, mls),
+]
+print(f"profiles: {nprof}")
+for name, loop, batched, data in cases:
+    assert np.allclose(loop(data, pmax, pmin), batched(data, pmax, pmin), rtol=1e-12)
+    tloop = timeit(lambda: loop(data, pmax, pmin), number=3) / 3
+    tvec = timeit(lambda: batched(data, pmax, pmin), number=3) / 3
+    line = f"{name:15s} per profile: {tloop * 1e3:8.1f} ms  "
+    line += f"batched: {tvec * 1e3:8.1f} ms  speedup: {tloop / tvec:6.1f}x"
+    print(line)
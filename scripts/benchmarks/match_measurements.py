@@ -0,0 +1,67 @@
+from ozone.analysis import match_measurements
+from datetime import datetime, timedelta
+from timeit import timeit
+
+import numpy as np
+
+
+def match_measurements_loop(mira2, mls):
+    m2_dt = [dt for dt in mira2.keys()]
+    m2_date = np.array([dt.date() for dt in mira2.keys()])
+    mls_dt = np.array([dt for dt in mls.keys()])
+    mls_date = np.array([dt.date() for dt in mls.keys()])
+
+    aks = dict()
+    mls_matching = dict()
+    mira2_matching = dict()
+
+    for d, mlsdt in zip(mls_date, mls_dt):
+        if d in m2_date:
+            idx = np.where(m2_date == d)[0]
+            dt = m2_dt[idx[0]]
+            aks[mlsdt] = mira2[dt]["avk"]
+            mls_matching[mlsdt] = mls[mlsdt]
+
+            for i in idx:
+                dt = m2_dt[i]
+                mira2_matching[dt] = mira2[dt]
+
+    return aks, mls_matching, mira2_matching
+
+
+def make_records(scale, rng):
+    # one winter has about 2000 screened MIRA2 retrievals and 1500
+    # MLS profiles, a larger scale is a longer record
+    start = datetime(2019, 10, 1)
+    ndays = 212 * scale
+    m2_seconds = np.sort(rng.uniform(0, ndays * 86400, 2000 * scale))
+    mls_seconds = np.sort(rng.uniform(0, ndays * 86400, 1500 * scale))
+    mira2 = {
+        start + timedelta(seconds=float(s)): {"avk": np.array([i])}
+        for i, s in enumerate(m2_seconds)
+    }
+    mls = {
+        start + timedelta(seconds=float(s)): {"O3": np.array([i])}
+        for i, s in enumerate(mls_seconds)
+    }
+    return mira2, mls
+
+
+def same(a, b):
+    return all(list(x) == list(y) for x, y in zip(a, b)) and all(
+        all(x[k] is y[k] for k in x) for x, y in zip(a, b)
+    )
+
+
+rng = np.random.default_rng(42)
+for scale in (1, 10, 100):
+    mira2, mls = make_records(scale, rng)
+    tvec = timeit(lambda: match_measurements(mira2, mls), number=1)
+    line = f"{scale:4d}x  mira2: {len(mira2):7d}  mls: {len(mls):7d}  "
+    line += f"sorted: {tvec:8.3f} s"
+    # the linear scan would take more than ten minutes at 100x
+    if scale <= 10:
+        assert same(match_measurements(mira2, mls), match_measurements_loop(mira2, mls))
+        tloop = timeit(lambda: match_measurements_loop(mira2, mls), number=1)
+        line += f"  scan: {tloop:8.3f} s  speedup: {tloop / tvec:8.1f}x"
+    print(line)
@@ -0,0 +1,128 @@
+from ozone.loss import ozone_loss, mira2_loss
+from datetime import datetime, timedelta
+from timeit import timeit
+
+import numpy as np
+
+
+def calculate_loss_script(o3passive, o3passive_err, dts, index, mdata):
+    # the MIRA2 branch of calculate_loss in scripts/ozone_loss/mira2_loss.py
+    dates = np.array([dt.date() for dt in dts])
+    dats = []
+    loss = []
+    loss_err = []
+    for dt, val in mdata.items():
+        d = dt.date()
+        if d in dates:
+            dateidx = np.where(dates == d)
+            i = index[dateidx].flatten()
+            o3p = np.mean(o3passive[dateidx])
+            o3pe = np.mean(o3passive_err[dateidx])
+            cov = val["S_phys"]
+            dcov = np.diag(cov)
+            o3me = np.mean(np.sqrt(dcov[i])) / 1e6
+            o3m = np.mean(val["x_phys"][i]) / 1e6
+
+            loss.append(o3m - o3p)
+            loss_err.append(o3pe + o3me)
+            dats.append(d)
+    return np.array(loss), np.array(loss_err), np.array(dats)
+
+
+def script_loss(loss, mls_dt, mdata, k):
+    # the script keeps the MLS profiles where the isopleth was found,
+    # with their level as returned by np.where
+    found = loss.valid[k]
+    index = np.array([(np.array([i]),) for i in loss.index[k, found]])
+    return calculate_loss_script(
+        loss.passive[k, found] / 1e6,
+        loss.passive_err[k, found] / 1e6,
+        mls_dt[found],
+        index,
+        mdata,
+    )
+
+
+def make_fixture(ndays, nmls, nm2, rng):
+    nlev = 30
+    pressure = np.logspace(4, 2, nlev)
+    start = datetime(2020, 1, 1, 0, 0, 0)
+    mls_dt = np.array(
+        [
+            start + timedelta(days=d, minutes=int(m))
+            for d in range(ndays)
+            if d % 5 != 3
+            for m in np.sort(rng.choice(1440, nmls, replace=False))
+        ]
+    )
+    m2_dt = np.array(
+        [
+            start + timedelta(days=d, minutes=int(m))
+            for d in range(ndays)
+            for m in np.sort(rng.choice(1440, nm2, replace=False))
+        ]
+    )
+
+    shape = (len(mls_dt), nlev)
+    n2o = np.linspace(300, 0, nlev) * 1e-9 + rng.normal(0, 20e-9, shape)
+    o3 = rng.normal(4e-6, 1e-6, shape)
+    o3_err = np.abs(rng.normal(0.2e-6, 0.05e-6, shape))
+    theta = np.linspace(350, 900, nlev) + rng.normal(0, 10, shape)
+    inside = rng.random(shape) < 0.9
+    fitparams = {
+        "params": np.array([0.1, -0.8, -0.1, 0.05, 0.01]),
+        "cov": np.diag([1e-4, 2e-4, 1e-4, 1e-5, 1e-6]),
+        "mux": 150e-9,
+        "sx": 80e-9,
+        "muy": 3e-6,
+        "sy": 1e-6,
+    }
+    loss = ozone_loss(
+        n2o, o3, o3_err, theta, pressure, inside, fitparams, np.array([200, 100, 50])
+    )
+
+    x_phys = rng.normal(4, 1, (len(m2_dt), nlev))
+    a = rng.normal(0, 0.3, (len(m2_dt), nlev, nlev))
+    s_phys = a @ a.transpose(0, 2, 1)
+    return loss, mls_dt, m2_dt, x_phys, s_phys
+
+
+def check(loss, mls_dt, m2_dt, x_phys, s_phys):
+    mdata = {
+        dt: {"x_phys": x, "S_phys": s} for dt, x, s in zip(m2_dt, x_phys, s_phys)
+    }
+    result = mira2_loss(loss, mls_dt, m2_dt, x_phys, s_phys)
+    for k in range(len(loss.isopleths)):
+        ref, ref_err, dats = script_loss(loss, mls_dt, mdata, k)
+        valid = result.valid[k]
+        days = np.array([dt.date() for dt in m2_dt[valid]])
+        assert np.array_equal(days, dats)
+        # the script took the measured minus the passive ozone, in vmr
+        assert np.allclose(result.loss[k, valid], -ref * 1e6, rtol=0, atol=1e-12)
+        assert np.allclose(result.loss_err[k, valid], ref_err * 1e6, rtol=0, atol=1e-12)
+
+
+# a few days, one of them without MLS profiles, to check the defaults
+rng = np.random.default_rng(42)
+check(*make_fixture(6, 5, 8, rng))
+
+# one winter, about 15 MLS profiles in the box and 100 retrievals a day
+loss, mls_dt, m2_dt, x_phys, s_phys = make_fixture(180, 15, 100, rng)
+mdata = {dt: {"x_phys": x, "S_phys": s} for dt, x, s in zip(m2_dt, x_phys, s_phys)}
+nloss = len(loss.isopleths)
+
+n = 3
+tloop = timeit(
+    lambda: [script_loss(loss, mls_dt, mdata, k) for k in range(nloss)], number=n
+)
+tvec = timeit(lambda: mira2_loss(loss, mls_dt, m2_dt, x_phys, s_phys), number=n)
+tnear = timeit(
+    lambda: mira2_loss(loss, mls_dt, m2_dt, x_phys, s_phys, pairing="nearest"),
+    number=n,
+)
+
+print(f"MLS profiles: {len(mls_dt)}, retrievals: {len(m2_dt)}, isopleths: {nloss}")
+print(f"script loop:     {tloop / n * 1e3:8.1f} ms")
+print(f"all same day:    {tvec / n * 1e3:8.1f} ms")
+print(f"nearest:         {tnear / n * 1e3:8.1f} ms")
+print(f"speedup:         {tloop / tvec:8.1f}x")
@@ -0,0 +1,59 @@
+from ozone.mira2 import physical_units
+from timeit import timeit
+
+import numpy as np
+
+
+def physical_units_loop(records):
+    for record in records:
+        M = 1e6 * np.diag(record["apriori"])
+        record["mr"] = np.array([sum(row) for row in record["avk"]])
+        record["x_phys"] = M @ record["x"]
+        if "Ss" in record:
+            S = record["Ss"] + record["So"]
+            record["S_phys"] = M @ S @ M.transpose()
+
+
+def make_records(n, rng):
+    records = []
+    for i in range(n):
+        record = {
+            "apriori": np.abs(rng.normal(5e-6, 1e-6, 41)),
+            "x": rng.normal(1, 0.1, 41),
+            "avk": rng.normal(0.02, 0.01, (41, 41)),
+        }
+        if i % 2:
+            record["Ss"] = rng.normal(0, 0.1, (41, 41))
+            record["So"] = rng.normal(0, 0.1, (41, 41))
+        # some retrievals with missing or diverged values
+        if i % 97 == 0:
+            record["x"][rng.integers(41)] = (np.nan, np.inf)[i % 2]
+            record["apriori"][rng.integers(41)] = np.nan
+            if "Ss" in record:
+                record["Ss"][rng.integers(41), rng.integers(41)] = np.inf
+        records.append(record)
+    return records
+
+
+# one winter of MIRA2 retrievals, about one every 15 minutes
+np.seterr(invalid="ignore")
+rng = np.random.default_rng(42)
+nrec = 20000
+records = make_records(nrec, rng)
+loop = [dict(record) for record in records]
+batched = [dict(record) for record in records]
+physical_units_loop(loop)
+physical_units(batched)
+for a, b in zip(loop, batched):
+    for key in ("mr", "x_phys", "S_phys"):
+        if key in a:
+            assert np.array_equal(a[key], b[key], equal_nan=True)
+
+n = 3
+tloop = timeit(lambda: physical_units_loop([dict(r) for r in records]), number=n) / n
+tvec = timeit(lambda: physical_units([dict(r) for r in records]), number=n) / n
+
+print(f"records: {nrec}, with covariances: {sum('Ss' in r for r in records)}")
+print(f"per record: {tloop * 1e3:8.1f} ms")
+print(f"batched:    {tvec * 1e3:8.1f} ms")
+print(f"speedup:    {tloop / tvec:8.1f}x")
@@ -0,0 +1,54 @@
+from ozone.analysis import pressure_region_weights, pressure_layer_weights
+from timeit import timeit
+
+import numpy as np
+
+
+def region_weights_loop(p, pmax, pmin):
+    edges = np.zeros(len(p) + 1)
+    edges[1:-1] = np.sqrt(p[:-1] * p[1:])
+    edges[0] = p[0] ** 2 / edges[1]
+    edges[-1] = p[-1] ** 2 / edges[-2]
+
+    w = np.zeros(len(p))
+    p_low = min(pmin, pmax)
+    p_high = max(pmin, pmax)
+    for i in range(len(p)):
+        lo = max(min(edges[i], edges[i + 1]), p_low)
+        hi = min(max(edges[i], edges[i + 1]), p_high)
+        w[i] = max(0.0, np.log(hi) - np.log(lo))
+    return w / w.sum()
+
+
+# the 41 level MIRA2 grid in Pa, a winter of retrievals and the
+# layers of the layer-mean time series
+rng = np.random.default_rng(42)
+pgrid = np.logspace(np.log10(2e4), np.log10(5), 41)
+layers = [(pmax, pmax / 2) for pmax in (10000, 5000, 2000, 1000, 500, 200, 100)]
+nprof = 2000
+x = rng.normal(5, 1, (nprof, 41))
+
+for pmax, pmin in layers:
+    assert np.array_equal(
+        region_weights_loop(pgrid, pmax, pmin),
+        pressure_region_weights(pgrid, pmax, pmin),
+    )
+
+
+def series_loop():
+    return np.array(
+        [[region_weights_loop(pgrid, *layer) @ v for v in x] for layer in layers]
+    )
+
+
+def series_matrix():
+    return x @ pressure_layer_weights(pgrid, layers).T
+
+
+assert np.allclose(series_loop().T, series_matrix(), rtol=1e-12, atol=0)
+tloop = timeit(series_loop, number=1)
+tvec = timeit(series_matrix, number=1)
+print(f"profiles: {nprof}  layers: {len(layers)}")
+print(f"weights per profile: {tloop * 1e3:8.1f} ms")
+print(f"cached matrix:       {tvec * 1e3:8.1f} ms")
+print(f"speedup:             {tloop / tvec:8.1f}x")
@@ -0,0 +1,52 @@
+from ozone.mls import select_profiles, make_datetime
+from haversine import haversine, Unit
+from datetime import date, datetime
+from timeit import timeit
+
+import numpy as np
+
+
+def select_profiles_loop(lat, lon, dt, loc, radii, start, end):
+    mask = np.zeros(len(dt), dtype=bool)
+    for i, _ in enumerate(dt):
+        if lat[i] <= 90 and lat[i] >= -90:
+            haversinedist = haversine(loc, (lat[i], lon[i]), unit=Unit.KILOMETERS)
+        else:
+            continue
+
+        if haversinedist <= radii and start <= dt[i].date() <= end:
+            mask[i] = True
+    return mask
+
+
+# one synthetic granule with the size of a daily MLS L2 file
+rng = np.random.default_rng(42)
+nprof = 3495
+loc = (67.84, 20.41)
+radii = 400
+start = date(2019, 10, 1)
+end = date(2020, 4, 30)
+
+lat = rng.uniform(-82, 82, nprof).astype(np.float32)
+lon = rng.uniform(-180, 180, nprof).astype(np.float32)
+near = rng.choice(nprof, 40, replace=False)
+lat[near] = loc[0] + rng.normal(0, 3, 40)
+lon[near] = loc[1] + rng.normal(0, 8, 40)
+lat[rng.choice(nprof, 5, replace=False)] = -999.99
+time = 852076800.0 + np.sort(rng.uniform(0, 86400, nprof))
+dt = make_datetime(time)
+
+args = (lat, lon, dt, loc, radii, start, end)
+loopargs = (lat, lon, dt.astype(datetime), loc, radii, start, end)
+loop = select_profiles_loop(*loopargs)
+vectorized = select_profiles(*args)
+assert np.array_equal(loop, vectorized)
+
+n = 20
+tloop = timeit(lambda: select_profiles_loop(*loopargs), number=n) / n
+tvec = timeit(lambda: select_profiles(*args), number=n) / n
+
+print(f"profiles per granule: {nprof}, selected: {vectorized.sum()}")
+print(f"loop:       {tloop * 1e3:8.3f} ms/granule")
+print(f"vectorized: {tvec * 1e3:8.3f} ms/granule")
+print(f"speedup:    {tloop / tvec:8.1f}x")
@@ -0,0 +1,39 @@
+from ozone.analysis import smooth_mls, smooth_profiles
+from timeit import timeit
+
+import numpy as np
+
+
+def smooth_loop(avks, values, apriori):
+    return [
+        smooth_mls(avk, {"O3_interp": x}, xa)
+        for avk, x, xa in zip(avks, values, apriori)
+    ]
+
+
+def smooth_batched(avks, values, apriori):
+    smoothed = smooth_profiles(avks, values, apriori)
+    return [row[np.isfinite(x)] for row, x in zip(smoothed, values)]
+
+
+# MLS profiles interpolated to the 41 MIRA2 levels, with the levels
+# outside the MLS grid missing, and the a priori of every retrieval
+rng = np.random.default_rng(42)
+nlev = 41
+for nprof in (1500, 15000):
+    avks = rng.normal(0.02, 0.01, (nprof, nlev, nlev))
+    values = rng.normal(5e-6, 1e-6, (nprof, nlev))
+    values[:, :3] = np.nan
+    values[rng.random(values.shape) < 0.02] = np.nan
+    apriori = rng.normal(5e-6, 1e-6, (nprof, nlev))
+
+    for a, b in zip(
+        smooth_loop(avks, values, apriori), smooth_batched(avks, values, apriori)
+    ):
+        assert np.allclose(a, b, rtol=1e-12, atol=0)
+
+    tloop = timeit(lambda: smooth_loop(avks, values, apriori), number=1)
+    tvec = timeit(lambda: smooth_batched(avks, values, apriori), number=1)
+    line = f"profiles: {nprof:6d}  per profile: {tloop * 1e3:8.1f} ms  "
+    line += f"batched: {tvec * 1e3:8.1f} ms  speedup: {tloop / tvec:8.1f}x"
+    print(line)
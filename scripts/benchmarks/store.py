@@ -0,0 +1,66 @@
+from ozone.store import save_product, load_product, load_columnar
+from datetime import datetime, timedelta
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from timeit import timeit
+
+import numpy as np
+
+
+def make_product(n, rng):
+    data = {}
+    start = datetime(2019, 12, 1)
+    for i in range(n):
+        dt = start + timedelta(minutes=15 * i)
+        data[dt] = {
+            "file": np.array([Path(f"/data/mira2/{dt:%Y%m%d}/ret_{i}.h5")]),
+            "meastime": np.array(timedelta(seconds=float(rng.uniform(600, 900)))),
+            "x": rng.normal(1, 0.1, 41),
+            "avk": rng.normal(0.02, 0.01, (41, 41)),
+            "convergence": rng.integers(0, 2),
+        }
+
+    # missing days are filled with NaN's of the same shape, see utils.fill_nans
+    shapes = {key: np.shape(value) for key, value in data[start].items()}
+    for day in range(3):
+        dt = start - timedelta(days=day + 1, hours=-12)
+        data[dt] = {key: np.full(shape, np.nan) for key, shape in shapes.items()}
+    return {key: data[key] for key in sorted(data)}
+
+
+def same(a, b):
+    # numeric fields are promoted to a common dtype, see ColumnarProduct.to_dict
+    a, b = np.asarray(a), np.asarray(b)
+    if a.shape != b.shape or (a.dtype == object) != (b.dtype == object):
+        return False
+    if a.dtype == object:
+        return all(x == y or (x != x and y != y) for x, y in zip(a.flat, b.flat))
+    return np.array_equal(a, b, equal_nan=True)
+
+
+# one winter of MIRA2 retrievals, about one every 15 minutes
+rng = np.random.default_rng(42)
+nrec = 5000
+data = make_product(nrec, rng)
+
+with TemporaryDirectory() as tmp:
+    npy = save_product(Path(tmp) / "product", data, store="npy")
+    h5 = save_product(Path(tmp) / "product", data, store="h5")
+
+    fromnpy = load_product(npy)
+    fromh5 = load_product(h5)
+    assert list(fromnpy) == list(fromh5)
+    for dt in fromnpy:
+        assert list(fromnpy[dt]) == list(fromh5[dt])
+        for key, value in fromnpy[dt].items():
+            assert same(value, fromh5[dt][key]), (dt, key)
+
+    n = 3
+    tnpy = timeit(lambda: load_product(npy), number=n) / n
+    th5 = timeit(lambda: load_product(h5), number=n) / n
+    tcol = timeit(lambda: load_columnar(h5)["x"].mean(axis=0), number=n) / n
+
+print(f"records: {len(data)}, of which filled: {len(data) - nrec}")
+print(f"npy as dict:       {tnpy * 1e3:8.1f} ms")
+print(f"h5 as dict:        {th5 * 1e3:8.1f} ms")
+print(f"h5 column mean:    {tcol * 1e3:8.1f} ms")
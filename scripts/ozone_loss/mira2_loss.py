@@ -54,7 +54,7 @@ def calculate_passive_ozone(inside_dates, mlsN2O, start, stop, fitparams, isople
             o3ps = poly4_odr(params, approx_s)
             o3p = o3ps * sy + ymean
             o3passive.append(o3p)
-            o3ps_err = polynomial_uncertainty(o3ps, cov)
+            o3ps_err = polynomial_uncertainty(approx_s, cov)
             o3p_err = o3ps_err * sy
             o3passive_err.append(o3p_err)
             index.append(i)
@@ -1,5 +1,10 @@
 from ozone.io import get_downloadsdir, get_home_data
-from ozone.analysis import poly4_odr, get_period, polynomial_uncertainty
+from ozone.analysis import (
+    poly4_odr,
+    get_period,
+    polynomial_uncertainty,
+    first_crossing,
+)
 from datetime import date
 
 import numpy as np
@@ -15,41 +20,29 @@ def calc_pottemp(t, p):
 
 
 def calculate_passive_ozone(start, stop, n2odata, fitparams, isolev):
-    o3passive = []
-    o3passive_err = []
-    thetalev = []
-    dts = []
-    for dt, val in n2odata.items():
-        d = dt.date()
-        if start <= d <= stop:
-            n2oval = val["N2O_interp"] * 1e9
-            theta = val["theta"]
-            edgemask = val["edgemask"]
-            n2omasked = n2oval[edgemask]
-            thetamasked = theta[edgemask]
-            params = fitparams["params"]
-            cov = fitparams["cov"]
-            xmean = fitparams["mux"]
-            ymean = fitparams["muy"]
-            sx = fitparams["sx"]
-            sy = fitparams["sy"]
-
-            try:
-                i = np.where(thetamasked >= isolev)[0][0]
-                dts.append(dt)
-                n2o50 = n2omasked[i] / 1e9
-                n2o_50_s = (n2o50 - xmean) / sx
-                o3ps = poly4_odr(params, n2o_50_s)
-                o3p = o3ps * sy + ymean
-                o3passive.append(o3p)
-                o3ps_err = polynomial_uncertainty(o3ps, cov)
-                o3p_err = o3ps_err * sy
-                o3passive_err.append(o3p_err)
-                thetalev.append(thetamasked[i])
-            except IndexError:
-                continue
-
-    return o3passive, o3passive_err, thetalev, dts
+    dts = [dt for dt in n2odata.keys() if start <= dt.date() <= stop]
+    n2oval = np.array([n2odata[dt]["N2O_interp"] * 1e9 for dt in dts])
+    theta = np.array([n2odata[dt]["theta"] for dt in dts])
+    edgemask = np.array([n2odata[dt]["edgemask"] for dt in dts], dtype=bool)
+    params = fitparams["params"]
+    cov = fitparams["cov"]
+    xmean = fitparams["mux"]
+    ymean = fitparams["muy"]
+    sx = fitparams["sx"]
+    sy = fitparams["sy"]
+
+    # first level inside the vortex at or above the isentrope
+    i, thetalev, found = first_crossing(theta, isolev, above=True, mask=edgemask)
+    rows = np.flatnonzero(found)
+    n2o50 = n2oval[rows, i[rows]] / 1e9
+    n2o_50_s = (n2o50 - xmean) / sx
+    o3ps = poly4_odr(params, n2o_50_s)
+    o3passive = o3ps * sy + ymean
+    o3ps_err = polynomial_uncertainty(n2o_50_s, cov)
+    o3passive_err = o3ps_err * sy
+
+    dts = [dts[j] for j in rows]
+    return list(o3passive), list(o3passive_err), list(thetalev[rows]), dts
 
 
 dmpdatap = get_downloadsdir() / "dmpdata.npy"
@@ -1,5 +1,6 @@
 from ozone.io import get_downloadsdir, get_egdefiles, get_datadir, get_home_data
 from ozone.analysis import parse_edgefile, filter_edgedata, binning, fit_n2o_o3
+from ozone.mls import make_datetime
 from scipy.interpolate import interp1d
 from pathlib import Path
 from h5py import File
@@ -41,46 +42,19 @@ def calc_pottemp(t, p):
     return pot
 
 
-def make_datetime(ts: float) -> datetime:
-    """Function to create datetime objects
-
-    This function takes the data in the 'TIME' field from
-    the .he5 MLS files and converts the time to a datetime
-    object and returns a numpy ndarray with these datetime
-    objects
-
-    Args:
-        seconds_array: array associated with the 'TIME' field
-
-    Returns:
-        numpy array with datetime objects
-    """
-    epoch = datetime(1993, 1, 1, 0, 0, 0)
-
-    dt = epoch + timedelta(seconds=ts)
-    dt = dt.replace(microsecond=0)
-    return dt
-
-
 def read_dmp(fp):
     with File(fp, "r") as fh:
         data = fh["HDFEOS"]
         swaths = data["SWATHS"]
-        timestamps = []
 
         altitude = swaths["Altitude/Data Fields/Altitude"][()]
         pveql = swaths["PVEquivalentLatitude"]
         theta = swaths["Theta/Data Fields/Theta"][()]
         pressure = pveql["Geolocation Fields/Pressure"][()]
         latitude = pveql["Geolocation Fields/Latitude"][()]
-        for ts in pveql["Geolocation Fields/Time"][()]:
-            try:
-                timestamp = make_datetime(ts)
-                timestamps.append(timestamp)
-            except OverflowError:
-                timestamps.append(np.nan)
-
-        timestamps = np.array(timestamps)
+        # fill values become None
+        timestamps = make_datetime(pveql["Geolocation Fields/Time"][()])
+        timestamps = timestamps.astype(datetime)
         mask = latitude >= 60
 
         return DMPdata(
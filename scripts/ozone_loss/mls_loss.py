@@ -1,6 +1,11 @@
 from ozone.io import get_downloadsdir, get_datadir, get_home_data, geted
 from ozone._const import COLORS
-from ozone.analysis import poly4_odr, get_period, polynomial_uncertainty
+from ozone.analysis import (
+    poly4_odr,
+    get_period,
+    polynomial_uncertainty,
+    first_crossing,
+)
 from datetime import datetime, date
 from scipy.interpolate import interp1d
 
@@ -10,46 +15,40 @@ from matplotlib.gridspec import GridSpec
 
 
 def calculate_passive_ozone(start, stop, n2odata, fitparams, isoplet):
-    o3passive = []
-    o3passive_err = []
-    thetalev = []
-    plevs = []
-    dts = []
-    for dt, val in n2odata.items():
-        d = dt.date()
-        if start <= d <= stop:
-            n2oval = val["N2O_interp"] * 1e9
-            theta = val["theta_interp"]
-            pressure = val["pressure_interp"]
-            edgemask = val["edgemask"]
-            n2omasked = n2oval[edgemask]
-            thetamasked = theta[edgemask]
-            pressuremasked = pressure[edgemask]
-            params = fitparams["params"]
-
-            cov = fitparams["cov"]
-            xmean = fitparams["mux"]
-            ymean = fitparams["muy"]
-            sx = fitparams["sx"]
-            sy = fitparams["sy"]
-
-            try:
-                i = np.where(n2oval[edgemask] <= isoplet)[0][0]
-                dts.append(dt)
-                n2o50 = n2omasked[i] / 1e9
-                n2o_50_s = (n2o50 - xmean) / sx
-                o3ps = poly4_odr(params, n2o_50_s)
-                o3p = o3ps * sy + ymean
-                o3passive.append(o3p)
-                o3ps_err = polynomial_uncertainty(o3ps, cov)
-                o3p_err = o3ps_err * sy
-                o3passive_err.append(o3p_err)
-                thetalev.append(thetamasked[i])
-                plevs.append(pressuremasked[i])
-            except IndexError:
-                continue
-
-    return o3passive, o3passive_err, thetalev, plevs, dts
+    dts = [dt for dt in n2odata.keys() if start <= dt.date() <= stop]
+    n2oval = np.array([n2odata[dt]["N2O_interp"] * 1e9 for dt in dts])
+    theta = np.array([n2odata[dt]["theta_interp"] for dt in dts])
+    pressure = np.array([n2odata[dt]["pressure_interp"] for dt in dts])
+    edgemask = np.array([n2odata[dt]["edgemask"] for dt in dts], dtype=bool)
+    params = fitparams["params"]
+
+    cov = fitparams["cov"]
+    xmean = fitparams["mux"]
+    ymean = fitparams["muy"]
+    sx = fitparams["sx"]
+    sy = fitparams["sy"]
+
+    # first level inside the vortex at or below the N2O isopleth
+    i, n2olev, found = first_crossing(n2oval, isoplet, mask=edgemask)
+    rows = np.flatnonzero(found)
+    i = i[rows]
+    n2o50 = n2olev[rows] / 1e9
+    n2o_50_s = (n2o50 - xmean) / sx
+    o3ps = poly4_odr(params, n2o_50_s)
+    o3passive = o3ps * sy + ymean
+    o3ps_err = polynomial_uncertainty(n2o_50_s, cov)
+    o3passive_err = o3ps_err * sy
+    thetalev = theta[rows, i]
+    plevs = pressure[rows, i]
+
+    dts = [dts[j] for j in rows]
+    return (
+        list(o3passive),
+        list(o3passive_err),
+        list(thetalev),
+        list(plevs),
+        dts,
+    )
 
 
 def calculate_loss(start, stop, n2odata, o3data, m2data, fitparams, isoplet):
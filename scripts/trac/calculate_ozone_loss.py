@@ -3,7 +3,7 @@ from matplotlib.gridspec import GridSpec
 import numpy as np
 
 from ozone.io import get_downloadsdir, get_datadir
-from ozone.analysis import poly4_odr, get_period
+from ozone.analysis import poly4_odr, get_period, first_crossing
 from collections import defaultdict
 
 
@@ -127,16 +127,18 @@ def make_cf(data):
 
 
 def get_O3(data, plev):
-    errs = []
-    rets = []
-    dts = []
-    for dt, val in data.items():
-        dts.append(dt)
-        i = np.where(val.pressure >= plev)[0][-1]
-        errs.append(val.err[i])
-        rets.append(val.retrieved[i])
-
-    return OzoneData(value=np.array(rets), error=np.array(errs), dt=np.array(dts))
+    dts = np.array([dt for dt in data.keys()])
+    pressure = np.array([val.pressure for val in data.values()])
+    errs = np.array([val.err for val in data.values()])
+    rets = np.array([val.retrieved for val in data.values()])
+
+    # the last level at or above plev is the first one from the top
+    top, _, found = first_crossing(pressure[:, ::-1], plev, above=True)
+    i = pressure.shape[1] - 1 - top
+    rows = np.flatnonzero(found)
+    i = i[rows]
+
+    return OzoneData(value=rets[rows, i], error=errs[rows, i], dt=dts[rows])
 
 
 dates = np.load(get_downloadsdir() / "dates.npz", allow_pickle=True)
@@ -9,6 +9,7 @@ from types import SimpleNamespace
 
 from ozone.analysis import fit_n2o_o3, poly4_odr, match_tracers, binning
 from ozone.io import get_downloadsdir, get_home_data
+from ozone.mls import make_datetime, JOINT_TRACERS, newer_tracers
 from ozone._const import COLORS
 
 
@@ -35,27 +36,6 @@ def dmp_files():
     return np.array(files)
 
 
-def make_datetime(ts: float) -> datetime:
-    """Function to create datetime objects
-
-    This function takes the data in the 'TIME' field from
-    the .he5 MLS files and converts the time to a datetime
-    object and returns a numpy ndarray with these datetime
-    objects
-
-    Args:
-        seconds_array: array associated with the 'TIME' field
-
-    Returns:
-        numpy array with datetime objects
-    """
-    epoch = datetime(1993, 1, 1, 0, 0, 0)
-
-    dt = epoch + timedelta(seconds=ts)
-    dt = dt.replace(microsecond=0)
-    return dt
-
-
 def read_dmp(fp):
     with File(fp, "r") as fh:
         data = fh["HDFEOS"]
@@ -66,7 +46,7 @@ def read_dmp(fp):
         pressure = eqlset["Geolocation Fields/Pressure"][()]
         latitude = eqlset["Geolocation Fields/Latitude"][()]
         timestamps = eqlset["Geolocation Fields/Time"][()]
-        timestamp = np.array([make_datetime(ts) for ts in timestamps])
+        timestamp = make_datetime(timestamps).astype(datetime)
         measdate = timestamp[0].date()
 
         return DMPdata(
@@ -89,16 +69,25 @@ def filter_measurements(tracedata, start, stop):
     return dct
 
 
-xdata_file = get_downloadsdir() / "N2O_tracer_screened.npy"
-xdata = np.load(xdata_file, allow_pickle=True).item()
-
-ydata_file = get_downloadsdir() / "O3_tracer_screened.npy"
-ydata = np.load(ydata_file, allow_pickle=True).item()
-
-
 start = date(2019, 12, 1)
 stop = date(2019, 12, 15)
-tracedata = match_tracers(xdata=xdata, ydata=ydata)
+# use the aligned tracers of tracersmake --joint instead of the screened products
+joint = False
+joint_file = get_downloadsdir() / JOINT_TRACERS
+if joint and newer_tracers(["N2O", "O3"], joint_file):
+    print(f"{joint_file} is older than the screened tracers, not using it")
+    joint = False
+
+if joint:
+    print(f"Using the joint tracers in {joint_file}")
+    tracedata = match_tracers(joint=joint_file)
+else:
+    xdata_file = get_downloadsdir() / "N2O_tracer_screened.npy"
+    xdata = np.load(xdata_file, allow_pickle=True).item()
+
+    ydata_file = get_downloadsdir() / "O3_tracer_screened.npy"
+    ydata = np.load(ydata_file, allow_pickle=True).item()
+    tracedata = match_tracers(xdata=xdata, ydata=ydata)
 filtered = filter_measurements(tracedata, start, stop)
 print(len(filtered))
 xval = []
@@ -12,6 +12,7 @@ import cartopy.crs as ccrs
 import cartopy.feature as cfeature
 
 from ozone.io import get_downloadsdir, get_datadir, get_home_data
+from ozone.mls import make_datetime
 
 
 @dataclass
@@ -37,27 +38,6 @@ class InsideVortexData:
     eqlmask: np.ndarray
 
 
-def make_datetime(ts: float) -> datetime:
-    """Function to create datetime objects
-
-    This function takes the data in the 'TIME' field from
-    the .he5 MLS files and converts the time to a datetime
-    object and returns a numpy ndarray with these datetime
-    objects
-
-    Args:
-        seconds_array: array associated with the 'TIME' field
-
-    Returns:
-        numpy array with datetime objects
-    """
-    epoch = datetime(1993, 1, 1, 0, 0, 0)
-
-    dt = epoch + timedelta(seconds=ts)
-    dt = dt.replace(microsecond=0)
-    return dt
-
-
 def dmp_files():
     home = Path.home()
     mlsdir = home / "MLS"
@@ -76,7 +56,6 @@ def read_dmp(fp):
     with File(fp, "r") as fh:
         data = fh["HDFEOS"]
         swaths = data["SWATHS"]
-        timestamps = []
 
         pv = swaths["PotentialVorticity/Data Fields/PotentialVorticity"][()]
         spv = swaths["ScaledPV/Data Fields/ScaledPV"][()]
@@ -88,14 +67,9 @@ def read_dmp(fp):
         latitude = pveql["Geolocation Fields/Latitude"][()]
         longitude = pveql["Geolocation Fields/Longitude"][()]
         pressure = pveql["Geolocation Fields/Pressure"][()]
-        for ts in pveql["Geolocation Fields/Time"][()]:
-            try:
-                timestamp = make_datetime(ts)
-                timestamps.append(timestamp)
-            except OverflowError:
-                timestamps.append(np.nan)
-
-        timestamps = np.array(timestamps)
+        # fill values become None
+        timestamps = make_datetime(pveql["Geolocation Fields/Time"][()])
+        timestamps = timestamps.astype(datetime)
 
         return DMPdata(
             eql=eql,
@@ -4,6 +4,7 @@ import numpy as np
 from datetime import datetime, timedelta, date
 import matplotlib.pyplot as plt
 from matplotlib.gridspec import GridSpec
+from ozone.mls import make_datetime
 
 
 def dmp_files():
@@ -80,23 +81,21 @@ def read_dgg_files(files):
             latitudes = geos["Latitude"][()]
             longitudes = geos["Longitude"][()]
             timestamps = geos["Time"][()]
-            start = date(2019, 11, 20)
-            stop = date(2019, 11, 25)
-
-            for pv, lat, lon, ts in zip(pvs, latitudes, longitudes, timestamps):
-                spv = pv * 1e5
-                try:
-                    dt = make_datetime(ts)
-                except OverflowError:
-                    continue
-                d = dt.date()
-                if (
-                    lat >= 70
-                    and spv >= 3.6
-                    and start <= d <= stop
-                    and -180 <= lon <= 180
-                ):
-                    dts.append(dt)
+            start = np.datetime64(date(2019, 11, 20))
+            stop = np.datetime64(date(2019, 11, 25))
+
+            spv = pvs * 1e5
+            dt = make_datetime(timestamps)
+            d = dt.astype("datetime64[D]")
+            mask = (
+                (latitudes >= 70)
+                & (spv >= 3.6)
+                & (start <= d)
+                & (d <= stop)
+                & (-180 <= longitudes)
+                & (longitudes <= 180)
+            )
+            dts.extend(dt[mask].astype(datetime))
 
     return dts
 
@@ -115,39 +114,15 @@ def get_species_data(files, species):
             timestamps = geos["Time"][()]
             pressure = geos["Pressure"][()]
 
-            for prod, ts, lat, lon in zip(data, timestamps, latitudes, longitudes):
-                try:
-                    dt = make_datetime(ts)
-                except OverflowError:
-                    continue
+            dts = make_datetime(timestamps)
+            mask = ~np.isnat(dts) & (latitudes >= 70)
 
-                if lat >= 70:
-                    dct[dt] = [prod, pressure]
+            for prod, dt in zip(data[mask], dts[mask].astype(datetime)):
+                dct[dt] = [prod, pressure]
 
     return dct
 
 
-def make_datetime(ts: float) -> datetime:
-    """Function to create datetime objects
-
-    This function takes the data in the 'TIME' field from
-    the .he5 MLS files and converts the time to a datetime
-    object and returns a numpy ndarray with these datetime
-    objects
-
-    Args:
-        seconds_array: array associated with the 'TIME' field
-
-    Returns:
-        numpy array with datetime objects
-    """
-    epoch = datetime(1993, 1, 1, 0, 0, 0)
-
-    dt = epoch + timedelta(seconds=ts)
-    dt = dt.replace(microsecond=0)
-    return dt
-
-
 # dmp = "/home/ric/Downloads/MLS-Aura_L2EDMP-GEOS5294-v201_v05-00-c01_2019d001.he5"
 dmpfiles = dmp_files()
 n2ofiles = n2o_files()
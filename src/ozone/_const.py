@@ -1,6 +1,7 @@
 from .arts import Ycalc
 from .mira2 import MIRA2FindAndMake
 from .analysis import MatchData
+from .loss import OzoneLoss
 from .mls import MLSFindAndMake
 from .mls import MLSFindAndMakeTracer
 from .screening import DataScreener
@@ -28,6 +29,7 @@ def cli_commands():
         "plotting": Plotting,
         "match": MatchData,
         "tracersmake": MLSFindAndMakeTracer,
+        "loss": OzoneLoss,
     }
 
     desc = {
@@ -38,6 +40,7 @@ def cli_commands():
         "match": "Used to match MIRA2 and MLS data. This also interpolates MLS data to a coarser grid and convolves the MLS data with the AK from the MIRA2 retrieval",
         "plotting": "Used to plot figures",
         "tracersmake": "Create datasets for tracer-tracer reference function",
+        "loss": "Calculate passive ozone and ozone loss on N2O isopleths or isentropes",
     }
 
     return commands, desc
@@ -2,30 +2,43 @@ import numpy as np
 from datetime import datetime
 from datetime import time
 from datetime import timedelta
-from scipy.interpolate import interp1d
 from numpy.typing import NDArray
 from typing import Dict
+from functools import lru_cache, partial
 
 from .io import get_downloadsdir, get_egdefiles, get_datadir
-from .utils import parse_edgefile, filter_edgedata
+from .utils import parse_edgefile, filter_edgedata, map_ordered
+from .store import load_product
+from .mls import KIRUNA, load_joint_tracers
+from haversine import haversine_vector, Unit
 from scipy.odr import RealData, Model, ODR
 from types import SimpleNamespace
 
 
 class MatchData:
-    def __init__(self, mira2, mls, logger):
+    def __init__(self, mira2, mls, logger, hours=None, km=None, nearest=True):
         self.logger = logger
         self.mira2_file = mira2
         self.mls_file = mls
-        self.mira2 = np.load(mira2, allow_pickle=True).item()
-        self.mls = np.load(mls, allow_pickle=True).item()
+        self.hours = hours
+        self.km = km
+        self.nearest = nearest
+        self.pairs = None
+        self.mira2 = load_product(mira2)
+        self.mls = load_product(mls)
         self.match_mira2_and_mls()
         if "O3" in self.mls_file.name:
             self.interp_mls()
         self.save_matching_data()
 
     def match_mira2_and_mls(self):
-        tup = match_measurements(self.mira2, self.mls)
+        if self.hours is None or self.km is None:
+            tup = match_measurements(self.mira2, self.mls)
+        else:
+            tup = match_coincident(
+                self.mira2, self.mls, self.hours, self.km, self.nearest
+            )
+            self.pairs = tup[3]
         self.avk_match = tup[0]
         self.mls_match = tup[1]
         self.mira2_match = tup[2]
@@ -48,6 +61,11 @@ class MatchData:
         self.logger.info(f"Saved matching MIRA2 data in {outdir / mira2_fn}")
         self.logger.info(f"Saved matching MLS data in {outdir / mls_fn}")
 
+        if self.pairs is not None:
+            pairs_fn = self.mira2_file.stem + "_coincidences.npy"
+            np.save(outdir / pairs_fn, self.pairs, allow_pickle=True)
+            self.logger.info(f"Saved coincident MLS datetimes in {outdir / pairs_fn}")
+
 
 def get_period(data: dict, period: str):
     rdata = {}
@@ -99,67 +117,401 @@ def mk_daterange(period: str):
     return np.array(daterange)
 
 
+def date_index(source: NDArray, target: NDArray) -> tuple:
+    """Function to find the sources on the dates of the targets
+
+    The source dates are sorted once, and the range of sources on
+    the date of every target is found with a binary search
+
+    Args:
+        source: datetimes to search
+        target: datetimes to find the dates of
+
+    Returns:
+        the indices sorting the sources by date, and for every
+        target the start and end of its date in the sorted sources.
+        Sources on the same date keep their order
+    """
+    source = np.asarray(source, dtype="datetime64[us]").astype("datetime64[D]")
+    target = np.asarray(target, dtype="datetime64[us]").astype("datetime64[D]")
+    order = np.argsort(source, kind="stable")
+    days = source[order]
+    lo = np.searchsorted(days, target, side="left")
+    hi = np.searchsorted(days, target, side="right")
+    return order, lo, hi
+
+
 def match_measurements(mira2, mls):
     m2_dt = [dt for dt in mira2.keys()]
-    m2_date = np.array([dt.date() for dt in mira2.keys()])
-    mls_dt = np.array([dt for dt in mls.keys()])
-    mls_date = np.array([dt.date() for dt in mls.keys()])
+    mls_dt = [dt for dt in mls.keys()]
 
     aks = dict()
     mls_matching = dict()
     mira2_matching = dict()
 
-    assert len(mls_dt) == len(mls_date)
+    order, lo, hi = date_index(m2_dt, mls_dt)
+    added = set()
+    for mlsdt, start, end in zip(mls_dt, lo, hi):
+        if start == end:
+            continue
 
-    for d, mlsdt in zip(mls_date, mls_dt):
-        if d in m2_date:
-            idx = np.where(m2_date == d)[0]
-            dt = m2_dt[idx[0]]
-            aks[mlsdt] = mira2[dt]["avk"]
-            mls_matching[mlsdt] = mls[mlsdt]
+        dt = m2_dt[order[start]]
+        aks[mlsdt] = mira2[dt]["avk"]
+        mls_matching[mlsdt] = mls[mlsdt]
 
-            for i in idx:
+        # every MIRA2 date is added once, when first matched
+        if start not in added:
+            added.add(start)
+            for i in order[start:end]:
                 dt = m2_dt[i]
                 mira2_matching[dt] = mira2[dt]
 
     return aks, mls_matching, mira2_matching
 
 
+def find_coincidences(
+    m2_dt: NDArray,
+    mls_dt: NDArray,
+    mls_lat: NDArray,
+    mls_lon: NDArray,
+    hours: float,
+    km: float,
+    nearest: bool = True,
+    site: tuple = KIRUNA,
+) -> tuple:
+    """Function to find coincident MIRA2 and MLS measurements
+
+    A MLS profile is coincident with a MIRA2 retrieval if it is
+    within the time window and within the distance from the MIRA2
+    site. The MLS times are sorted once and the window of every
+    retrieval is found with a binary search
+
+    Args:
+        m2_dt: datetimes of the MIRA2 retrievals
+        mls_dt: datetimes of the MLS profiles
+        mls_lat: latitudes of the MLS profiles
+        mls_lon: longitudes of the MLS profiles
+        hours: largest time difference in hours
+        km: largest distance from the site in kilometers
+        nearest: if only the MLS profile nearest in time should be
+            kept for every retrieval, otherwise all are kept
+        site: latitude and longitude of MIRA2
+
+    Returns:
+        indices of the MIRA2 retrievals and of the MLS profiles of
+        every coincident pair, sorted by retrieval and time difference
+    """
+    m2_time = np.asarray(m2_dt, dtype="datetime64[us]")
+    mls_time = np.asarray(mls_dt, dtype="datetime64[us]")
+    window = np.timedelta64(int(round(hours * 3600e6)), "us")
+
+    order = np.argsort(mls_time, kind="stable")
+    times = mls_time[order]
+    lo = np.searchsorted(times, m2_time - window, side="left")
+    hi = np.searchsorted(times, m2_time + window, side="right")
+
+    # all MLS profiles in the window of every retrieval
+    counts = hi - lo
+    m2_idx = np.repeat(np.arange(len(m2_time)), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    mls_idx = order[np.repeat(lo, counts) + offset]
+
+    lat = np.asarray(mls_lat, dtype=np.float64)
+    lon = np.asarray(mls_lon, dtype=np.float64)
+    valid = (lat <= 90) & (lat >= -90)
+    distance = haversine_vector(
+        site,
+        np.column_stack((np.where(valid, lat, 0.0), lon)),
+        unit=Unit.KILOMETERS,
+        comb=True,
+        check=False,
+    ).ravel()
+    close = valid & (distance <= km)
+
+    keep = close[mls_idx]
+    m2_idx, mls_idx = m2_idx[keep], mls_idx[keep]
+    delta = np.abs(mls_time[mls_idx] - m2_time[m2_idx])
+
+    sort = np.lexsort((delta, m2_idx))
+    m2_idx, mls_idx = m2_idx[sort], mls_idx[sort]
+    if nearest:
+        _, first = np.unique(m2_idx, return_index=True)
+        m2_idx, mls_idx = m2_idx[first], mls_idx[first]
+    return m2_idx, mls_idx
+
+
+def match_coincident(mira2, mls, hours, km, nearest=True):
+    """Function to match coincident MIRA2 and MLS measurements
+
+    Gives the same outputs as match_measurements, but with the
+    coincidences from find_coincidences instead of the same date.
+    An MLS profile coincident with several retrievals gets the AVK
+    of the retrieval nearest in time
+
+    Args:
+        mira2: MIRA2 data keyed by datetime
+        mls: MLS data keyed by datetime
+        hours: largest time difference in hours
+        km: largest distance from the MIRA2 site in kilometers
+        nearest: if only the MLS profile nearest in time should be
+            kept for every retrieval
+
+    Returns:
+        the AVK's, MLS data and MIRA2 data of the coincidences,
+        and the MLS datetimes coincident with every retrieval
+    """
+    m2_dt = [dt for dt in mira2.keys()]
+    mls_dt = [dt for dt in mls.keys()]
+    lat = np.array([v["lat"] for v in mls.values()], dtype=np.float64)
+    lon = np.array([v["lon"] for v in mls.values()], dtype=np.float64)
+
+    m2_idx, mls_idx = find_coincidences(
+        m2_dt, mls_dt, lat, lon, hours=hours, km=km, nearest=nearest
+    )
+
+    pairs = dict()
+    for i, j in zip(m2_idx, mls_idx):
+        pairs.setdefault(m2_dt[i], []).append(mls_dt[j])
+
+    # the retrieval nearest in time to every MLS profile
+    delta = np.abs(
+        np.asarray(mls_dt, dtype="datetime64[us]")[mls_idx]
+        - np.asarray(m2_dt, dtype="datetime64[us]")[m2_idx]
+    )
+    sort = np.lexsort((delta, mls_idx))
+    _, first = np.unique(mls_idx[sort], return_index=True)
+    closest = dict(zip(mls_idx[sort][first], m2_idx[sort][first]))
+
+    aks = dict()
+    mls_matching = dict()
+    for j in sorted(closest):
+        aks[mls_dt[j]] = mira2[m2_dt[closest[j]]]["avk"]
+        mls_matching[mls_dt[j]] = mls[mls_dt[j]]
+
+    mira2_matching = {m2_dt[i]: mira2[m2_dt[i]] for i in np.unique(m2_idx)}
+    return aks, mls_matching, mira2_matching, pairs
+
+
+def interp_linear(xsource: NDArray, values: NDArray, xtarget: NDArray) -> NDArray:
+    """Function to interpolate a stack of profiles on a shared grid
+
+    Gives the same results as interpolating every profile with
+    scipy's interp1d(kind="linear", bounds_error=False,
+    fill_value=np.nan), including its use of np.interp for float64
+    grids and values, but finds the interpolation intervals once
+    for all profiles
+
+    Args:
+        xsource: (n_levels,) grid of the profiles
+        values: (n_profiles, n_levels) values of the profiles
+        xtarget: (n_target,) grid to interpolate to
+
+    Returns:
+        (n_profiles, n_target) interpolated values, NaN outside
+        the source grid
+    """
+    x = np.asarray(xsource)
+    if not np.issubdtype(x.dtype, np.inexact):
+        x = x.astype(np.float64)
+    y = np.asarray(values)
+    if not np.issubdtype(y.dtype, np.inexact):
+        y = y.astype(np.float64)
+    xnew = np.asarray(xtarget)
+    if not np.issubdtype(xnew.dtype, np.inexact):
+        xnew = xnew.astype(np.float64)
+
+    order = np.argsort(x, kind="mergesort")
+    x = x[order]
+    y = y[:, order]
+
+    if x.dtype == np.float64 and y.dtype == np.float64:
+        ynew = _interp_np(x, y, xnew)
+    else:
+        idx = np.searchsorted(x, xnew).clip(1, len(x) - 1)
+        lo = idx - 1
+        slope = (y[:, idx] - y[:, lo]) / (x[idx] - x[lo])
+        ynew = slope * (xnew - x[lo]) + y[:, lo]
+
+    outside = (xnew < x[0]) | (xnew > x[-1])
+    ynew[:, outside] = np.nan
+    return ynew
+
+
+def _interp_np(x: NDArray, y: NDArray, xnew: NDArray) -> NDArray:
+    # np.interp for every row of y, points outside x are set by the caller
+    j = (np.searchsorted(x, xnew, side="right") - 1).clip(0, len(x) - 1)
+    j1 = (j + 1).clip(0, len(x) - 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (y[:, j1] - y[:, j]) / (x[j1] - x[j])
+        ynew = slope * (xnew - x[j]) + y[:, j]
+        # if the slope is NaN from one side, np.interp tries the other
+        retry = slope * (xnew - x[j1]) + y[:, j1]
+    ynew = np.where(np.isnan(ynew), retry, ynew)
+    ynew = np.where(np.isnan(ynew) & (y[:, j] == y[:, j1]), y[:, j], ynew)
+
+    exact = (x[j] == xnew) | (j == len(x) - 1)
+    ynew[:, exact] = y[:, j[exact]]
+    ynew[:, np.isnan(xnew)] = np.nan
+    return ynew
+
+
+def interp_profiles(sources: list, values: list, xtarget: NDArray) -> list:
+    """Function to interpolate profiles on their own grids
+
+    The profiles are grouped by grid and dtype, and every group
+    is interpolated at once with interp_linear
+
+    Args:
+        sources: the grid of every profile
+        values: the values of every profile
+        xtarget: grid to interpolate to
+
+    Returns:
+        the interpolated values of every profile
+    """
+    groups = {}
+    for i, (x, y) in enumerate(zip(sources, values)):
+        x, y = np.asarray(x), np.asarray(y)
+        key = (x.tobytes(), x.dtype.str, x.shape, y.dtype.str, y.shape)
+        groups.setdefault(key, []).append(i)
+
+    result = [None] * len(values)
+    for index in groups.values():
+        stack = np.stack([np.asarray(values[i]) for i in index])
+        ynew = interp_linear(sources[index[0]], stack, xtarget)
+        for i, row in zip(index, ynew):
+            result[i] = row
+    return result
+
+
+def first_crossing(
+    values: NDArray,
+    threshold: NDArray,
+    above: bool = False,
+    mask: NDArray | None = None,
+    coordinate: NDArray | None = None,
+    interpolate: bool = False,
+) -> tuple:
+    """Function to find the first level where profiles cross a threshold
+
+    Works on stacks of profiles with the levels along the last axis,
+    and replaces np.where(cond)[0][0] in per-profile loops
+
+    Args:
+        values: (..., n_levels) values of the profiles
+        threshold: threshold, broadcast against values[..., 0], e.g.
+            (n_thresholds, 1) for several thresholds and profiles
+        above: if the first level at or above the threshold should be
+            found, instead of at or below it
+        mask: levels that can be found, by default all
+        coordinate: coordinate of the levels to return, like the
+            potential temperature or the pressure, by default values
+        interpolate: if the coordinate should be linearly interpolated
+            to the threshold between the first level and the one
+            before it, when that level is in the mask
+
+    Returns:
+        the index of the first level, -1 where none was found, the
+        coordinate at that level or at the crossing, NaN where none
+        was found, and a mask with the profiles where one was found
+    """
+    values = np.asarray(values, dtype=np.float64)
+    threshold = np.asarray(threshold, dtype=np.float64)[..., None]
+    cond = values >= threshold if above else values <= threshold
+    if mask is not None:
+        cond = cond & mask
+    valid = cond.any(axis=-1)
+    index = cond.argmax(axis=-1)
+
+    values = np.broadcast_to(values, cond.shape)
+    coordinate = values if coordinate is None else coordinate
+    coordinate = np.broadcast_to(np.asarray(coordinate, dtype=np.float64), cond.shape)
+    level = index[..., None]
+    value = np.take_along_axis(coordinate, level, axis=-1)[..., 0]
+
+    if interpolate:
+        before = (level - 1).clip(0)
+        v0 = np.take_along_axis(values, before, axis=-1)[..., 0]
+        v1 = np.take_along_axis(values, level, axis=-1)[..., 0]
+        c0 = np.take_along_axis(coordinate, before, axis=-1)[..., 0]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = (threshold[..., 0] - v0) / (v1 - v0)
+            crossing = c0 + t * (value - c0)
+        bracket = (index > 0) & np.isfinite(t)
+        if mask is not None:
+            mask = np.broadcast_to(mask, cond.shape)
+            bracket &= np.take_along_axis(mask, before, axis=-1)[..., 0]
+        value = np.where(bracket, crossing, value)
+
+    index = np.where(valid, index, -1)
+    value = np.where(valid, value, np.nan)
+    return index, value, valid
+
+
 def interp_mls(avk, mls, ptarget, apriori):
-    for dt, a in avk.items():
+    dts = [dt for dt in avk.keys()]
+    for dt in dts:
         assert dt in mls.keys()
-        psource = mls[dt]["pressure"] * 1e2
-        vmr = mls[dt]["O3"]
-        precision = mls[dt]["precision"]
+    if len(dts) == 0:
+        return mls
 
+    log_src = [np.log(mls[dt]["pressure"] * 1e2) for dt in dts]
+    log_tgt = np.log(ptarget)
+    vmr = interp_profiles(log_src, [mls[dt]["O3"] for dt in dts], log_tgt)
+    precision = interp_profiles(log_src, [mls[dt]["precision"] for dt in dts], log_tgt)
+
+    # the a priori is shared, or keyed like the AVK's if it differs
+    if isinstance(apriori, dict):
+        apriori = np.array([apriori[dt] for dt in dts])
+    smoothed = smooth_profiles(np.array([avk[dt] for dt in dts]), vmr, apriori)
+
+    for i, dt in enumerate(dts):
         mls[dt]["p_interp"] = ptarget
-        log_src = np.log(psource)
-        log_tgt = np.log(ptarget)
-        interp_vmr = interp1d(
-            log_src,
-            vmr,
-            kind="linear",
-            bounds_error=False,
-            fill_value=np.nan,
-        )
-        interp_precision = interp1d(
-            log_src,
-            precision,
-            kind="linear",
-            bounds_error=False,
-            fill_value=np.nan,
-        )
-        mls[dt]["O3_interp"] = interp_vmr(log_tgt)
-        mls[dt]["O3_interp_smooth"] = smooth_mls(
-            avk=avk[dt],
-            mls=mls[dt],
-            apriori=apriori,
-        )
-        mls[dt]["precision_interp"] = interp_precision(log_tgt)
+        mls[dt]["O3_interp"] = vmr[i]
+        mls[dt]["O3_interp_smooth"] = smoothed[i][np.isfinite(vmr[i])]
+        mls[dt]["precision_interp"] = precision[i]
 
     return mls
 
 
+def smooth_profiles(avks: NDArray, values: NDArray, apriori: NDArray) -> NDArray:
+    """Function to smooth a stack of profiles with their AVK's
+
+    Applies (I - A) x_a + A x to every profile, using only the
+    levels where the profile is finite, like smooth_mls. Missing
+    levels are masked out of the profiles instead of indexed away
+    from the AVK's, so the whole stack is smoothed at once
+
+    Args:
+        avks: (n_profiles, n_levels, n_levels) averaging kernels
+        values: (n_profiles, n_levels) profiles to smooth, NaN
+            at missing levels
+        apriori: (n_levels,) a priori shared by all profiles, or
+            (n_profiles, n_levels) with the a priori of every profile
+
+    Returns:
+        (n_profiles, n_levels) smoothed profiles, NaN at the
+        missing levels
+    """
+    avks = np.asarray(avks)
+    values = np.asarray(values)
+    apriori = np.broadcast_to(apriori, values.shape)
+
+    mask = np.isfinite(values)
+    if not np.all(np.isfinite(avks)):
+        # the AVK's are only used at the finite levels of the profile
+        avks = np.where(mask[:, :, None] & mask[:, None, :], avks, 0.0)
+    x = np.where(mask, values, 0.0)
+    xa = np.where(mask, apriori, 0.0)
+
+    # the missing levels are zero in x and x_a, so they drop out of
+    # the sums, and the rows of the missing levels are discarded
+    smoothed = xa - np.einsum("nij,nj->ni", avks, xa, optimize=True)
+    smoothed += np.einsum("nij,nj->ni", avks, x, optimize=True)
+    smoothed[~mask] = np.nan
+    return smoothed
+
+
 def smooth_mls(avk, mls, apriori):
     shape = avk.shape[0]
     prod = mls["O3_interp"]
@@ -236,6 +588,9 @@ def pressure_region_weights(p: NDArray, pmax: float, pmin: float) -> NDArray:
     Rodgers OEM weight vector for pressure-averaged quantity,
     using ONLY pressure centers (monotonically decreasing).
 
+    The weights are cached on the grid and the region, so profiles
+    sharing a grid only compute them once. The returned array is
+    read-only, copy it before changing it.
 
     :param p: Pressure array
     :param pmax: Bottom of slice
@@ -244,6 +599,28 @@ def pressure_region_weights(p: NDArray, pmax: float, pmin: float) -> NDArray:
     :return: Weights
     """
     p = np.asarray(p)
+    return _region_weights(p.tobytes(), p.dtype.str, p.shape, pmax, pmin)
+
+
+def pressure_layer_weights(p: NDArray, layers: list) -> NDArray:
+    """Function to get the weights of several pressure regions at once
+
+    Args:
+        p: pressure grid of the profiles
+        layers: (pmax, pmin) of every region
+
+    Returns:
+        read-only (n_layers, n_levels) matrix with the weights of
+        every region as rows, see pressure_region_weights. The
+        layer means of a stack of profiles are profiles @ matrix.T
+    """
+    p = np.asarray(p)
+    return _layer_weights(p.tobytes(), p.dtype.str, p.shape, tuple(layers))
+
+
+@lru_cache(maxsize=256)
+def _region_weights(grid, dtype, shape, pmax, pmin):
+    p = np.frombuffer(grid, dtype=dtype).reshape(shape)
 
     # ---- build edges from centers (geometric midpoints: log-grid safe)
     edges = np.zeros(len(p) + 1)
@@ -252,56 +629,166 @@ def pressure_region_weights(p: NDArray, pmax: float, pmin: float) -> NDArray:
     edges[-1] = p[-1] ** 2 / edges[-2]
 
     # ---- Rodgers overlap weighting
-    N = len(p)
-    w = np.zeros(N)
-
     p_low = min(pmin, pmax)
     p_high = max(pmin, pmax)
 
-    for i in range(N):
-        lo = max(min(edges[i], edges[i + 1]), p_low)
-        hi = min(max(edges[i], edges[i + 1]), p_high)
+    # min and max of every edge pair and the region, as the builtins
+    top = np.where(edges[1:] < edges[:-1], edges[1:], edges[:-1])
+    bottom = np.where(edges[1:] > edges[:-1], edges[1:], edges[:-1])
+    lo = np.where(p_low > top, p_low, top)
+    hi = np.where(p_high < bottom, p_high, bottom)
 
-        w[i] = max(0.0, np.log(hi) - np.log(lo))
+    w = np.log(hi) - np.log(lo)
+    w = np.where(w > 0.0, w, 0.0)
 
     if w.sum() == 0:
         raise ValueError("No overlap with pressure region.")
 
-    return w / w.sum()
+    w = w / w.sum()
+    w.flags.writeable = False
+    return w
+
+
+@lru_cache(maxsize=64)
+def _layer_weights(grid, dtype, shape, layers):
+    rows = [_region_weights(grid, dtype, shape, pmax, pmin) for pmax, pmin in layers]
+    matrix = np.array(rows).reshape(len(layers), -1)
+    matrix.flags.writeable = False
+    return matrix
+
+
+def layer_weights(grids: list, pmax: float, pmin: float) -> NDArray:
+    """Function to stack the pressure region weights of many profiles
+
+    Args:
+        grids: pressure grid of every profile
+        pmax: bottom of the region
+        pmin: top of the region
+
+    Returns:
+        (n_profiles, n_levels) weights, see pressure_region_weights.
+        Profiles sharing one grid share one read-only row
+    """
+    try:
+        stacked = np.array(grids)
+    except ValueError:
+        stacked = None
+    shared = stacked is not None and stacked.ndim == 2
+    shared = shared and len({np.asarray(p).dtype for p in grids}) == 1
+    if shared and np.all(stacked == stacked[0]):
+        weights = pressure_region_weights(p=grids[0], pmax=pmax, pmin=pmin)
+        return np.broadcast_to(weights, stacked.shape)
+
+    weights = [pressure_region_weights(p=p, pmax=pmax, pmin=pmin) for p in grids]
+    return np.array(weights).reshape(len(weights), -1)
+
+
+def _mask_weights(weights, mask, renormalise):
+    weights = np.where(mask, weights, 0.0)
+    if renormalise:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            weights = weights / weights.sum(axis=1, keepdims=True)
+    return weights
+
+
+def layer_mean(
+    values: NDArray,
+    weights: NDArray,
+    mask: NDArray | None = None,
+    renormalise: bool = True,
+) -> NDArray:
+    """Function to get the weighted layer mean of a stack of profiles
+
+    Args:
+        values: (n_profiles, n_levels) values of the profiles
+        weights: (n_levels,) weights shared by the profiles, or
+            (n_profiles, n_levels) with the weights of every profile
+        mask: levels to use, by default the finite values
+        renormalise: if the weights of every profile should be
+            scaled to sum to one over the levels used
+
+    Returns:
+        (n_profiles,) layer means, NaN for profiles without levels
+        in the layer when renormalising
+    """
+    values = np.asarray(values)
+    mask = np.isfinite(values) if mask is None else np.asarray(mask, dtype=bool)
+    weights = _mask_weights(np.broadcast_to(weights, values.shape), mask, renormalise)
+    return np.einsum("nl,nl->n", weights, np.where(mask, values, 0.0))
+
+
+def layer_variance(
+    covariance: NDArray,
+    weights: NDArray,
+    mask: NDArray | None = None,
+    renormalise: bool = True,
+) -> NDArray:
+    """Function to propagate the covariance of profiles to their layer means
+
+    Args:
+        covariance: (n_profiles, n_levels) variances of uncorrelated
+            levels, or (n_profiles, n_levels, n_levels) covariances
+        weights: (n_levels,) weights shared by the profiles, or
+            (n_profiles, n_levels) with the weights of every profile
+        mask: levels to use, by default the levels with a finite
+            variance
+        renormalise: if the weights of every profile should be
+            scaled to sum to one over the levels used
+
+    Returns:
+        (n_profiles,) variances w.T @ S @ w of the layer means
+    """
+    covariance = np.asarray(covariance)
+    diagonal = covariance.ndim == 2
+    sig2 = covariance if diagonal else np.diagonal(covariance, axis1=1, axis2=2)
+    mask = np.isfinite(sig2) if mask is None else np.asarray(mask, dtype=bool)
+    weights = _mask_weights(np.broadcast_to(weights, sig2.shape), mask, renormalise)
+
+    if diagonal:
+        return np.einsum("nl,nl->n", weights, np.where(mask, sig2, 0.0) * weights)
+
+    if not np.all(mask):
+        covariance = np.where(mask[:, :, None] & mask[:, None, :], covariance, 0.0)
+    projected = np.einsum("ni,nij->nj", weights, covariance, optimize=True)
+    return np.einsum("nj,nj->n", projected, weights)
 
 
 def make_weighted_mean(data: Dict, pmax: float, pmin: float) -> NDArray:
     """Function to get the pressure weighted mean from a region in the atmosphere
 
+    MLS profiles use the weights of their finite levels without
+    renormalising them, as before the batched layer_mean
+
     :param data: Dictionary with retrieval data
     :param s: Start of slice
     :param e: End of slice
     :return: Array with pressure wighted means from s to e on all data
     """
-    means = []
-    for v in data.values():
-        try:
-            p = v["pgrid"]
-            vmr = v["x_phys"]
-            # dp = pressure_thickness(p)
-            # w = np.zeros(len(vmr))
-            # w[s:e] = dp[s:e] / np.sum(dp[s:e])
-            w = pressure_region_weights(p=p, pmax=pmax, pmin=pmin)
-            vmr_mean = w @ vmr
-            means.append(vmr_mean)
-        except KeyError:
-            p = v["p_interp"]
-            vmr = v["O3_interp_smooth"]
-            interped = v["O3_interp"]
-            mask = np.isfinite(interped)
-            # dp = pressure_thickness(p)
-            # w = np.zeros(len(vmr))
-            # w[s:e] = dp[s:e] / np.sum(dp[s:e])
-            w = pressure_region_weights(p=p, pmax=pmax, pmin=pmin)
-            vmr_mean = w[mask] @ vmr
-            means.append(vmr_mean)
+    records = list(data.values())
+    if len(records) == 0:
+        return np.array([])
+    means = np.empty(len(records))
+    mira2 = np.array([("pgrid" in v and "x_phys" in v) for v in records], dtype=bool)
+
+    index = np.flatnonzero(mira2)
+    if len(index):
+        values = np.array([records[i]["x_phys"] for i in index])
+        weights = layer_weights([records[i]["pgrid"] for i in index], pmax, pmin)
+        means[index] = layer_mean(values, weights, np.ones(values.shape, bool), False)
+
+    index = np.flatnonzero(~mira2)
+    if len(index):
+        interped = np.array([records[i]["O3_interp"] for i in index])
+        mask = np.isfinite(interped)
+        # the smoothed profiles only hold the finite levels
+        values = np.zeros(interped.shape)
+        values[mask] = np.concatenate(
+            [records[i]["O3_interp_smooth"] for i in index]
+        )
+        weights = layer_weights([records[i]["p_interp"] for i in index], pmax, pmin)
+        means[index] = layer_mean(values, weights, mask, False)
 
-    return np.array(means)
+    return means
 
 
 def poly4_odr(beta, x):
@@ -319,6 +806,103 @@ def polynomial_uncertainty(x, pcov):
     return sigma
 
 
+def poly4_ensemble(ensemble: NDArray, x: NDArray) -> NDArray:
+    """Function to evaluate an ensemble of quartic fits at once
+
+    Args:
+        ensemble: (n_members, 5) coefficients, see poly4_odr
+        x: values to evaluate the fits at
+
+    Returns:
+        (n_members, *x.shape) values of every member
+    """
+    x = np.asarray(x, dtype=np.float64)
+    powers = x[..., None] ** np.arange(5)
+    return np.moveaxis(powers @ np.asarray(ensemble).T, -1, 0)
+
+
+def _odr_fit(xs, ys, errxs, errys):
+    data = RealData(x=xs, y=ys, sx=errxs, sy=errys)
+    model = Model(poly4_odr)
+    beta0 = [1, 0, 0, 0, 0]
+    odr = ODR(data, model, beta0=beta0)
+    return odr.run()
+
+
+def _odr_resamples(members, xs, ys, errxs, errys, method, entropy, n_resamples):
+    betas = []
+    for i in members:
+        if method == "bootstrap":
+            rng = np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(i,)))
+            index = rng.integers(0, len(xs), len(xs))
+        else:
+            # delete-a-group jackknife, every member leaves out one block
+            drop = np.array_split(np.arange(len(xs)), n_resamples)[i]
+            index = np.setdiff1d(np.arange(len(xs)), drop, assume_unique=True)
+        output = _odr_fit(xs[index], ys[index], errxs[index], errys[index])
+        betas.append(output.beta)
+    return betas
+
+
+def odr_ensemble(
+    xs: NDArray,
+    ys: NDArray,
+    errxs: NDArray,
+    errys: NDArray,
+    method: str = "bootstrap",
+    n_resamples: int = 200,
+    workers: int = 1,
+    seed: int | None = None,
+) -> tuple:
+    """Function to refit the quartic ODR fit on resampled data
+
+    The resamples are split into one part per worker, so the data
+    is only sent once to every worker process. Every bootstrap
+    resample has its own seed, so the ensemble does not depend on
+    the number of workers
+
+    Args:
+        xs: standardised x values
+        ys: standardised y values
+        errxs: standardised x errors
+        errys: standardised y errors
+        method: 'bootstrap', resampling the pairs with replacement, or
+            'jackknife', leaving out one of n_resamples blocks at a time
+        n_resamples: number of resamples
+        workers: number of worker processes
+        seed: seed of the bootstrap resamples
+
+    Returns:
+        (n_resamples, 5) coefficients of the ensemble and their
+        (5, 5) covariance
+    """
+    if method not in ("bootstrap", "jackknife"):
+        raise ValueError(f"Unknown resampling method {method}")
+
+    entropy = np.random.SeedSequence(seed).entropy
+    parts = [part for part in np.array_split(np.arange(n_resamples), workers)]
+    parts = [part.tolist() for part in parts if len(part)]
+    func = partial(
+        _odr_resamples,
+        xs=xs,
+        ys=ys,
+        errxs=errxs,
+        errys=errys,
+        method=method,
+        entropy=entropy,
+        n_resamples=n_resamples,
+    )
+    betas = [beta for part in map_ordered(func, parts, workers) for beta in part]
+    ensemble = np.array(betas)
+
+    if method == "bootstrap":
+        cov = np.cov(ensemble, rowvar=False)
+    else:
+        deviation = ensemble - ensemble.mean(axis=0)
+        cov = (n_resamples - 1) / n_resamples * deviation.T @ deviation
+    return ensemble, cov
+
+
 def fit_n2o_o3(
     x: NDArray,
     y: NDArray,
@@ -327,7 +911,35 @@ def fit_n2o_o3(
     filename: str,
     xmin=None,
     xmax=None,
+    resample: str | None = None,
+    n_resamples: int = 200,
+    workers: int = 1,
+    seed: int | None = None,
 ) -> SimpleNamespace:
+    """Function to fit the N2O-O3 reference function
+
+    A quartic is fitted with ODR to the standardised pairs, and saved
+    with the standardisation in a .npz file in the downloads directory.
+    With resample, the fit is repeated on resampled pairs, see
+    odr_ensemble, and the ensemble and its covariance are saved as
+    'ensemble' and 'ensemble_cov' as well
+
+    Args:
+        x: N2O values, raw or binned
+        y: O3 values
+        errx: N2O errors
+        erry: O3 errors
+        filename: name of the .npz file
+        xmin: start of the fitted curve, the smallest x by default
+        xmax: end of the fitted curve, the largest x by default
+        resample: None, 'bootstrap' or 'jackknife'
+        n_resamples: number of resamples
+        workers: number of worker processes for the resamples
+        seed: seed of the bootstrap resamples
+
+    Returns:
+        the fit parameters, and the fitted curve with its uncertainty
+    """
     xs = (x - x.mean()) / x.std()
     ys = (y - y.mean()) / y.std()
     errxs = errx / x.std()
@@ -335,11 +947,7 @@ def fit_n2o_o3(
     ddir = get_downloadsdir()
     savepath = ddir / filename
 
-    data = RealData(x=xs, y=ys, sx=errxs, sy=errys)
-    model = Model(poly4_odr)
-    beta0 = [1, 0, 0, 0, 0]
-    odr = ODR(data, model, beta0=beta0)
-    output = odr.run()
+    output = _odr_fit(xs, ys, errxs, errys)
     popt = output.beta
     pcov = output.cov_beta
 
@@ -351,6 +959,11 @@ def fit_n2o_o3(
         sx=x.std(),
         sy=y.std(),
     )
+    if resample is not None:
+        results.ensemble, results.ensemble_cov = odr_ensemble(
+            xs, ys, errxs, errys, resample, n_resamples, workers, seed
+        )
+
     if xmin is None or xmax is None:
         xfit = np.linspace(x.min(), x.max(), 400)
     else:
@@ -362,27 +975,83 @@ def fit_n2o_o3(
     sfit = y.std() * sfit_s
 
     fit = SimpleNamespace(xfit=xfit, yfit=yfit, sfit=sfit)
+    if resample is not None:
+        fit.sfit_ensemble = y.std() * polynomial_uncertainty(
+            xfit_s, results.ensemble_cov
+        )
 
-    np.savez_compressed(
-        file=savepath,
-        params=results.params,
-        cov=results.cov,
-        mux=results.mux,
-        muy=results.muy,
-        sx=results.sx,
-        sy=results.sy,
-    )
+    np.savez_compressed(file=savepath, **vars(results))
     return results, fit
 
 
+def reference_ozone(fitparams, n2o: NDArray) -> SimpleNamespace:
+    """Function to get the passive ozone from the N2O-O3 reference function
+
+    Args:
+        fitparams: the loaded .npz file from fit_n2o_o3, or its results
+        n2o: N2O values, of any shape
+
+    Returns:
+        the passive ozone 'o3' and its uncertainty 'err' from the
+        ODR covariance. If the fit has an ensemble, also the passive
+        ozone of every member 'ensemble', with the members along the
+        first axis, and the uncertainty 'ensemble_err' from the
+        ensemble covariance
+    """
+    if isinstance(fitparams, SimpleNamespace):
+        fitparams = vars(fitparams)
+
+    n2o_s = (np.asarray(n2o) - fitparams["mux"]) / fitparams["sx"]
+    sy = fitparams["sy"]
+    o3_s = poly4_odr(fitparams["params"], n2o_s)
+    passive = SimpleNamespace(
+        o3=o3_s * sy + fitparams["muy"],
+        err=_poly4_sigma(n2o_s, fitparams["cov"]) * sy,
+        ensemble=None,
+        ensemble_err=None,
+    )
+    if "ensemble" in fitparams:
+        passive.ensemble = poly4_ensemble(fitparams["ensemble"], n2o_s) * sy
+        passive.ensemble += fitparams["muy"]
+        passive.ensemble_err = _poly4_sigma(n2o_s, fitparams["ensemble_cov"]) * sy
+    return passive
+
+
+def _poly4_sigma(x, cov):
+    x = np.asarray(x, dtype=np.float64)
+    return polynomial_uncertainty(x.ravel(), cov).reshape(x.shape)
+
+
+def bin_segments(xdata: NDArray, n_bins: int) -> tuple:
+    """Function to group data into quantile bins of xdata
+
+    Args:
+        xdata: values to bin
+        n_bins: number of bins, with equally many values
+
+    Returns:
+        the indices sorting the data by bin, keeping the order of
+        the data within every bin, and the (n_bins + 1) boundaries
+        of the bins in the sorted data. Values above the last bin
+        edge are not in any bin, as with np.digitize
+    """
+    xdata = np.asarray(xdata)
+    bins = np.quantile(xdata, np.linspace(0, 1, n_bins + 1))
+    indices = np.digitize(xdata, bins)
+    order = np.argsort(indices, kind="stable")
+    bounds = np.searchsorted(indices[order], np.arange(1, len(bins) + 1))
+    return order, bounds
+
+
 def binning(
     xdata, ydata, xerr, yerr, n_bins=200, core_percentile=(50, 50), min_bin_points=10
 ):
-    quantiles = np.linspace(0, 1, n_bins + 1)
-    bins = np.quantile(xdata, quantiles)
-    indices = np.digitize(xdata, bins)
-
-    keep = np.zeros_like(ydata, dtype=bool)
+    # the data is sorted by bin once, and every bin is a slice of it
+    order, bounds = bin_segments(xdata, n_bins)
+    xdata = np.asarray(xdata)[order]
+    ydata = np.asarray(ydata)[order]
+    xerr = np.asarray(xerr)[order]
+    yerr = np.asarray(yerr)[order]
 
     x_centers = []
     y_median = []
@@ -391,22 +1060,20 @@ def binning(
 
     p_low, p_high = core_percentile
 
-    for i in range(1, len(bins)):
-        m = indices == i
-        if np.sum(m) < min_bin_points:
-            print("here")
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if end - start < min_bin_points:
             continue
 
-        lo = np.percentile(ydata[m], p_low)
-        hi = np.percentile(ydata[m], p_high)
+        y_all = ydata[start:end]
+        lo = np.percentile(y_all, p_low)
+        hi = np.percentile(y_all, p_high)
 
-        core = m & (ydata >= lo) & (ydata <= hi)
-        keep |= core
+        core = (y_all >= lo) & (y_all <= hi)
 
-        x_bin = xdata[core]
-        y_bin = ydata[core]
-        xerr_bin = xerr[core]
-        yerr_bin = yerr[core]
+        x_bin = xdata[start:end][core]
+        y_bin = y_all[core]
+        xerr_bin = xerr[start:end][core]
+        yerr_bin = yerr[start:end][core]
 
         N = len(x_bin)
         if N == 0:
@@ -441,7 +1108,67 @@ def binning(
     )
 
 
-def match_tracers(xdata, ydata):
+def interp_joint(names: list, dts: list, ptarget: NDArray, path=None) -> tuple:
+    """Function to get tracers of the joint tracer file on a pressure grid
+
+    The profiles are found by their datetime in the time index of the
+    file, only the profiles passing the screening of all tracers are
+    used, see load_joint_tracers
+
+    Args:
+        names: product names of the tracers, e.g. ['N2O', 'O3']
+        dts: datetimes of the profiles
+        ptarget: (n_levels,) pressure grid to interpolate to
+        path: path of the joint tracer file
+
+    Returns:
+        mask with the datetimes found in the file, and a dictionary
+        with '<name>' and '<name>_precision' of the found profiles as
+        (n_found, n_levels) arrays on ptarget
+    """
+    joint = load_joint_tracers(names, path)
+    target = np.array(dts, dtype="datetime64[us]")
+    found = np.zeros(len(target), dtype=bool)
+    index = np.zeros(len(target), dtype=int)
+    if len(joint.time) > 0:
+        index = np.searchsorted(joint.time, target).clip(max=len(joint.time) - 1)
+        found = joint.time[index] == target
+    index = index[found]
+
+    keys = [key for name in names for key in (name, f"{name}_precision")]
+    if len(index) == 0:
+        return found, {key: np.empty((0, len(ptarget))) for key in keys}
+
+    logtgt = np.log(ptarget)
+    profiles = {}
+    for name in names:
+        logsrc = np.log(joint.columns[f"{name}_pressure"][0])
+        for key in (name, f"{name}_precision"):
+            values = joint.columns[key][index]
+            profiles[key] = interp_linear(logsrc, values, logtgt)
+    return found, profiles
+
+
+def match_tracers(xdata=None, ydata=None, joint=None):
+    """Function to match N2O and O3 profiles inside the vortex
+
+    With a joint tracer file the aligned tracers of that file are used,
+    see interp_joint. Otherwise the N2O and O3 products are joined on
+    their datetimes and saved with the interpolated profiles
+
+    Args:
+        xdata: the screened N2O tracer product
+        ydata: the screened O3 tracer product
+        joint: path of the joint tracer file from 'tracersmake --joint',
+            used instead of the products
+
+    Returns:
+        dictionary keyed by datetime with the N2O 'xval' and O3 'yval'
+        inside the vortex, and their errors 'xerr' and 'yerr'
+    """
+    if joint is None and (xdata is None or ydata is None):
+        raise ValueError("Give the N2O and O3 products or the joint tracer file")
+
     ydatapath = get_downloadsdir() / "O3_tracers_screened_matched.npy"
     xdatapath = get_downloadsdir() / "N2O_tracers_screened_matched.npy"
     pressurepath = get_datadir() / "m2pres.npz"
@@ -488,6 +1215,20 @@ def match_tracers(xdata, ydata):
     #            except KeyError:
     #                continue
 
+    # pres_thetas = np.load(pressurepath, allow_pickle=True)
+    # ptarget = pres_thetas["pressure"]
+    ptarget = np.load(pressurepath)["pressure"]
+    if joint is not None:
+        found, profiles = interp_joint(["N2O", "O3"], vortexdts, ptarget, joint)
+        return _vortex_pairs(
+            vortex,
+            [dt for dt, ok in zip(vortexdts, found) if ok],
+            profiles["N2O"],
+            profiles["N2O_precision"],
+            profiles["O3"],
+            profiles["O3_precision"],
+        )
+
     matchx = {}
     matchy = {}
     pottemp = {}
@@ -507,74 +1248,46 @@ def match_tracers(xdata, ydata):
         except KeyError:
             continue
 
-    xdt = np.array([dt for dt in matchx.keys()])
-    ydt = np.array([dt for dt in matchy.keys()])
-    if len(xdt) <= len(ydt):
-        dts = xdt
-    else:
-        dts = ydt
+    # every profile in matchy is also in matchx
+    dts = np.array([dt for dt in matchy.keys()])
+    if len(dts) == 0:
+        np.save(xdatapath, matchx, allow_pickle=True)
+        np.save(ydatapath, matchy, allow_pickle=True)
+        return {}
 
-    dts = ydt
-    dct = {}
-    # pres_thetas = np.load(pressurepath, allow_pickle=True)
-    # ptarget = pres_thetas["pressure"]
-    ptarget = np.load(pressurepath)["pressure"]
     logtgt = np.log(ptarget)
 
-    for dt in dts:
-        xsource = xpres
-        ysource = ypres
-
-        xvalcoarse = matchx[dt]["N2O"]
-        xerrcoarse = matchx[dt]["precision"]
-        yvalcoarse = matchy[dt]["O3"]
-        yerrcoarse = matchy[dt]["precision"]
-
-        logsrcx = np.log(xsource)
-        logsrcy = np.log(ysource)
-
-        interpx = interp1d(
-            logsrcx,
-            xvalcoarse,
-            kind="linear",
-            bounds_error=False,
-            fill_value=np.nan,
-        )
-        interperrx = interp1d(
-            logsrcx,
-            xerrcoarse,
-            kind="linear",
-            bounds_error=False,
-            fill_value=np.nan,
-        )
+    logsrcx = np.log(xpres)
+    logsrcy = np.log(ypres)
+    n2o = interp_linear(logsrcx, np.array([matchx[dt]["N2O"] for dt in dts]), logtgt)
+    n2o_err = interp_linear(
+        logsrcx, np.array([matchx[dt]["precision"] for dt in dts]), logtgt
+    )
+    o3 = interp_linear(logsrcy, np.array([matchy[dt]["O3"] for dt in dts]), logtgt)
+    o3_err = interp_linear(
+        logsrcy, np.array([matchy[dt]["precision"] for dt in dts]), logtgt
+    )
 
-        interpy = interp1d(
-            logsrcy,
-            yvalcoarse,
-            kind="linear",
-            bounds_error=False,
-            fill_value=np.nan,
-        )
-        interperry = interp1d(
-            logsrcy,
-            yerrcoarse,
-            kind="linear",
-            bounds_error=False,
-            fill_value=np.nan,
-        )
+    for i, dt in enumerate(dts):
+        matchx[dt]["N2O_interp"] = n2o[i]
+        matchx[dt]["precision_interp"] = n2o_err[i]
+        matchy[dt]["O3_interp"] = o3[i]
+        matchy[dt]["precision_interp"] = o3_err[i]
 
-        matchx[dt]["N2O_interp"] = interpx(logtgt)
-        matchx[dt]["precision_interp"] = interperrx(logtgt)
-        matchy[dt]["O3_interp"] = interpy(logtgt)
-        matchy[dt]["precision_interp"] = interperry(logtgt)
+    np.save(xdatapath, matchx, allow_pickle=True)
+    np.save(ydatapath, matchy, allow_pickle=True)
+    return _vortex_pairs(vortex, dts, n2o, n2o_err, o3, o3_err)
 
-        vmask = vortexmask[dt]
-        print(ptarget[vmask])
 
-        yval = matchy[dt]["O3_interp"][vmask]
-        yerr = matchy[dt]["precision_interp"][vmask]
-        xval = matchx[dt]["N2O_interp"][vmask]
-        xerr = matchx[dt]["precision_interp"][vmask]
+def _vortex_pairs(vortex, dts, n2o, n2o_err, o3, o3_err) -> dict:
+    dct = {}
+    for i, dt in enumerate(dts):
+        vmask = vortex[dt]["edgemask"]
+
+        yval = o3[i][vmask]
+        yerr = o3_err[i][vmask]
+        xval = n2o[i][vmask]
+        xerr = n2o_err[i][vmask]
 
         mask = (yval > 0) & (xval > 0) & (yerr > 0) & (xerr > 0)
 
@@ -584,37 +1297,22 @@ def match_tracers(xdata, ydata):
             xerr=xerr[mask],
             yerr=yerr[mask],
         )
-
-    np.save(xdatapath, matchx, allow_pickle=True)
-    np.save(ydatapath, matchy, allow_pickle=True)
     return dct
 
 
 def propagate_uncertainty_mls(data: dict, pmax: int, pmin: int) -> NDArray:
-    variances = []
-    for v in data.values():
-        p = v["p_interp"]
-        sig2 = (v["precision_interp"] * 1e6) ** 2
-        # dp = pressure_thickness(p)
-        # w = np.zeros(len(p))
-        # w[s:e] = dp[s:e] / np.sum(dp[s:e])
-        w = pressure_region_weights(p=p, pmax=pmax, pmin=pmin)
-        D = np.diag(sig2)
-        variances.append(w.T @ D @ w)
-
-    return np.array(variances)
+    records = list(data.values())
+    if len(records) == 0:
+        return np.array([])
+    sig2 = np.array([(v["precision_interp"] * 1e6) ** 2 for v in records])
+    weights = layer_weights([v["p_interp"] for v in records], pmax, pmin)
+    return layer_variance(sig2, weights, np.ones(sig2.shape, bool), False)
 
 
 def propagate_uncertainty_mira2(data: Dict, pmax: float, pmin: float) -> NDArray:
-    variances = []
-    for v in data.values():
-        p = v["pgrid"]
-        # dp = pressure_thickness(p)
-        # w = np.zeros(len(p))
-        # w[s:e] = dp[s:e] / np.sum(dp[s:e])
-        w = pressure_region_weights(p=p, pmax=pmax, pmin=pmin)
-        covar = v["S_phys"]
-        sig2 = w.T @ covar @ w
-        variances.append(sig2)
-
-    return np.array(variances)
+    records = list(data.values())
+    if len(records) == 0:
+        return np.array([])
+    covar = np.array([v["S_phys"] for v in records])
+    weights = layer_weights([v["pgrid"] for v in records], pmax, pmin)
+    return layer_variance(covar, weights, np.ones(covar.shape[:2], bool), False)
@@ -8,6 +8,7 @@ from .parsers import (
     plotting_parser,
     match_parser,
     tracers_parser,
+    loss_parser,
 )
 from .logger import get_logger
 from .screening import MIRA2Screener, MLSScreener
@@ -41,6 +42,8 @@ def cli():
                 plotting_parser(subparser)
             case "tracersmake":
                 tracers_parser(subparser)
+            case "loss":
+                loss_parser(subparser)
 
     args = parser.parse_args()
     logger = get_logger()
@@ -59,15 +62,35 @@ def cli():
 
         case "m2make":
             m2make = commands[args.command]
-            m2make(root=args.root, make=args.make, logger=logger)
+            m2make(
+                root=args.root,
+                make=args.make,
+                logger=logger,
+                dataset=args.dataset,
+                store=args.store,
+                workers=args.workers,
+                split=args.split_spectra,
+            )
 
         case "mlsmake":
             mlsmake = commands[args.command]
-            mlsmake(root=args.root, logger=logger)
+            mlsmake(
+                root=args.root,
+                logger=logger,
+                workers=args.workers,
+                incremental=args.incremental,
+                store=args.store,
+            )
 
         case "tracersmake":
             tracersmake = commands[args.command]
-            tracersmake(root=args.root, logger=logger)
+            tracersmake(
+                root=args.root,
+                logger=logger,
+                workers=args.workers,
+                store=args.store,
+                joint=args.joint,
+            )
 
         case "screen":
             mlsdp = ["O3", "H2O", "N2O", "ClO"]
@@ -77,7 +100,14 @@ def cli():
 
             if args.dataset in mlsdp:
                 mlsmake = commands["mlsmake"]
-                mlsmake(root=args.root, logger=logger)
+                mlsmake(
+                    root=args.root,
+                    logger=logger,
+                    workers=args.workers,
+                    incremental=args.incremental,
+                    store=args.store,
+                    reuse=not args.force,
+                )
                 obj = datascreen(dataset=args.dataset, filename=args.filename)
                 mlsscreen = MLSScreener(
                     data=obj.data,
@@ -85,12 +115,28 @@ def cli():
                     screen=obj.screen,
                     logger=logger,
                     winter=True,
+                    pressure_range=args.pressure_range,
                 )
-                mlsscreen.save_screened_data(filename=args.filename)
+                if args.sweep:
+                    mlsscreen.save_sweep(
+                        filename=args.filename, sweeps=args.sweep, workers=args.workers
+                    )
+                else:
+                    mlsscreen.save_screened_data(
+                        filename=args.filename, store=args.store
+                    )
 
             else:
                 m2make = commands["m2make"]
-                m2make(root=args.root, logger=logger, make=True, dataset=args.dataset)
+                m2make(
+                    root=args.root,
+                    logger=logger,
+                    make=True,
+                    dataset=args.dataset,
+                    store=args.store,
+                    workers=args.workers,
+                    reuse=not args.force,
+                )
                 obj = datascreen(dataset=args.dataset, filename=args.filename)
                 mira2screen = MIRA2Screener(
                     data=obj.data,
@@ -98,7 +144,14 @@ def cli():
                     screen=obj.screen,
                     logger=logger,
                 )
-                mira2screen.save_screened_data(filename=args.filename)
+                if args.sweep:
+                    mira2screen.save_sweep(
+                        filename=args.filename, sweeps=args.sweep, workers=args.workers
+                    )
+                else:
+                    mira2screen.save_screened_data(
+                        filename=args.filename, store=args.store
+                    )
 
         case "match":
             matching = commands[args.command]
@@ -111,8 +164,42 @@ def cli():
 
             if not mlsfile.exists() or not mira2file.exists():
                 logger.error("Check filepaths for the screened MIRA2 and MLS data")
+            elif (args.hours is None) != (args.km is None):
+                logger.error("Provide both --hours and --km for coincidence matching")
+            else:
+                matching(
+                    mira2=mira2file,
+                    mls=mlsfile,
+                    logger=logger,
+                    hours=args.hours,
+                    km=args.km,
+                    nearest=not args.all,
+                )
+
+        case "loss":
+            loss = commands[args.command]
+            if args.fit is None or args.isopleths is None:
+                return logger.error("Provide the fit file and the isopleths")
+            paths = [args.fit, args.n2o, args.o3, args.vortex, args.mira2, args.joint]
+            paths = [path for path in paths if isinstance(path, str)]
+            if not all(Path(path).exists() for path in paths):
+                logger.error("Check filepaths for the fit, tracer and vortex data")
             else:
-                matching(mira2=mira2file, mls=mlsfile, logger=logger)
+                loss(
+                    fit=args.fit,
+                    isopleths=args.isopleths,
+                    logger=logger,
+                    coordinate=args.coordinate,
+                    n2o=args.n2o,
+                    o3=args.o3,
+                    vortex=args.vortex,
+                    mira2=args.mira2,
+                    period=args.period,
+                    ensemble=args.ensemble,
+                    joint=args.joint,
+                    pairing=args.pairing,
+                    error=args.error,
+                )
 
         case "plotting":
             plotting = commands[args.command]
@@ -0,0 +1,433 @@
+from .io import get_downloadsdir, get_datadir
+from .analysis import reference_ozone, get_period, first_crossing, interp_joint
+from .store import load_product
+from .mls import JOINT_TRACERS, newer_tracers
+from numpy.typing import NDArray
+from pathlib import Path
+from types import SimpleNamespace
+import numpy as np
+
+
+def isopleth_levels(
+    n2o: NDArray,
+    theta: NDArray,
+    inside: NDArray,
+    isopleths: NDArray,
+    coordinate: str = "n2o",
+) -> tuple:
+    """Function to find the level of every isopleth in every profile
+
+    The level is the first level inside the vortex where the N2O
+    is at or below the isopleth, in ppbv, or where the potential
+    temperature is at or above it, in K
+
+    Args:
+        n2o: (n_profiles, n_levels) N2O volume mixing ratios
+        theta: (n_profiles, n_levels) potential temperatures
+        inside: (n_profiles, n_levels) mask with the levels inside
+            the vortex
+        isopleths: (n_isopleths,) N2O or potential temperature values
+        coordinate: 'n2o' or 'theta'
+
+    Returns:
+        (n_isopleths, n_profiles) level indices, -1 where the isopleth
+        was not found, and a mask with the profiles where it was found
+    """
+    isopleths = np.asarray(isopleths, dtype=np.float64)[:, None]
+    match coordinate:
+        case "n2o":
+            ppbv = np.asarray(n2o) * 1e9
+            index, _, valid = first_crossing(ppbv, isopleths, mask=inside)
+        case "theta":
+            index, _, valid = first_crossing(theta, isopleths, above=True, mask=inside)
+        case _:
+            raise ValueError(f"Unknown isopleth coordinate {coordinate}")
+
+    return index, valid
+
+
+def ozone_loss(
+    n2o: NDArray,
+    o3: NDArray,
+    o3_err: NDArray,
+    theta: NDArray,
+    pressure: NDArray,
+    inside: NDArray,
+    fitparams,
+    isopleths: NDArray,
+    coordinate: str = "n2o",
+    ensemble: bool = False,
+) -> SimpleNamespace:
+    """Function to get the passive ozone and the ozone loss of MLS profiles
+
+    The passive ozone is the N2O-O3 reference function at the N2O of
+    every isopleth level, see isopleth_levels, and the loss is the
+    passive ozone minus the measured ozone at that level. The errors
+    of the passive and measured ozone are added in quadrature
+
+    Args:
+        n2o: (n_profiles, n_levels) N2O volume mixing ratios
+        o3: (n_profiles, n_levels) O3 volume mixing ratios
+        o3_err: (n_profiles, n_levels) O3 precisions
+        theta: (n_profiles, n_levels) potential temperatures
+        pressure: (n_levels,) pressure grid of the profiles
+        inside: (n_profiles, n_levels) mask with the levels inside
+            the vortex
+        fitparams: the loaded .npz file from fit_n2o_o3
+        isopleths: (n_isopleths,) N2O, in ppbv, or potential
+            temperature, in K, of the isopleths
+        coordinate: 'n2o' or 'theta'
+        ensemble: if the passive ozone error should come from the
+            resampled ensemble of the fit instead of the ODR covariance
+
+    Returns:
+        (n_isopleths, n_profiles) arrays with the level 'index', its
+        'theta', 'pressure' and 'N2O', the 'passive' and measured
+        'O3' and the 'loss' with 'loss_err', all ozone in ppmv. The
+        mask 'valid' has the profiles where the isopleth was found,
+        the other values are NaN and the index is -1
+    """
+    n2o = np.asarray(n2o, dtype=np.float64)
+    o3 = np.asarray(o3, dtype=np.float64)
+    o3_err = np.asarray(o3_err, dtype=np.float64)
+    theta = np.asarray(theta, dtype=np.float64)
+    found, valid = isopleth_levels(n2o, theta, inside, isopleths, coordinate)
+    index = np.where(valid, found, 0)
+    rows = np.arange(n2o.shape[0])
+
+    passive = reference_ozone(fitparams, n2o[rows, index])
+    if ensemble:
+        if passive.ensemble_err is None:
+            raise ValueError("The fit has no resampled ensemble")
+        passive_err = passive.ensemble_err
+    else:
+        passive_err = passive.err
+
+    result = SimpleNamespace(
+        isopleths=np.asarray(isopleths, dtype=np.float64),
+        valid=valid,
+        index=found,
+        theta=theta[rows, index],
+        pressure=np.asarray(pressure, dtype=np.float64)[index],
+        N2O=n2o[rows, index],
+        passive=passive.o3 * 1e6,
+        passive_err=passive_err * 1e6,
+        O3=o3[rows, index] * 1e6,
+        O3_err=o3_err[rows, index] * 1e6,
+    )
+    result.loss = result.passive - result.O3
+    result.loss_err = np.sqrt(result.O3_err**2 + result.passive_err**2)
+
+    _mask_invalid(result)
+    return result
+
+
+def _mask_invalid(result):
+    for name in vars(result):
+        if name not in ("isopleths", "valid", "index", "mls", "count"):
+            getattr(result, name)[~result.valid] = np.nan
+
+
+def nearest_same_day(source: NDArray, target: NDArray) -> tuple:
+    """Function to find the source nearest in time on the date of every target
+
+    Args:
+        source: datetimes to search, in increasing order
+        target: datetimes to find the nearest source of
+
+    Returns:
+        the index of the nearest source of every target, and a
+        mask with the targets that have a source on their date
+    """
+    source = np.asarray(source, dtype="datetime64[us]")
+    target = np.asarray(target, dtype="datetime64[us]")
+    if len(source) == 0:
+        return np.zeros(len(target), dtype=int), np.zeros(len(target), dtype=bool)
+
+    after = np.searchsorted(source, target).clip(0, len(source) - 1)
+    before = (after - 1).clip(0, len(source) - 1)
+
+    # the sources on the date of a target are around it in time, so
+    # the nearest on the date is either of the bracketing sources
+    day = target.astype("datetime64[D]")
+    after_ok = source[after].astype("datetime64[D]") == day
+    before_ok = source[before].astype("datetime64[D]") == day
+    closer = np.abs(source[after] - target) < np.abs(target - source[before])
+    nearest = np.where(after_ok & (closer | ~before_ok), after, before)
+    same_day = after_ok | before_ok
+    return nearest, same_day
+
+
+def mira2_loss(
+    loss: SimpleNamespace,
+    mls_dt: NDArray,
+    m2_dt: NDArray,
+    x_phys: NDArray,
+    s_phys: NDArray,
+    pairing: str = "all",
+    error: str = "linear",
+) -> SimpleNamespace:
+    """Function to get the ozone loss of MIRA2 retrievals
+
+    By default every retrieval uses all MLS profiles on its date where
+    the isopleth was found, as scripts/ozone_loss/mira2_loss.py does.
+    The passive ozone and its error are the means over these profiles,
+    and the ozone and its error the means of the retrieval at their
+    isopleth levels. With pairing 'nearest' only the MLS profile nearest
+    in time on the same date is used
+
+    Args:
+        loss: the loss of the MLS profiles, see ozone_loss
+        mls_dt: datetimes of the MLS profiles, in increasing order
+        m2_dt: datetimes of the retrievals
+        x_phys: (n_retrievals, n_levels) ozone of the retrievals, in
+            ppmv, on the grid of the MLS profiles
+        s_phys: (n_retrievals, n_levels, n_levels) covariances of
+            the retrievals, in ppmv**2
+        pairing: 'all' MLS profiles on the date of a retrieval, or the
+            'nearest' of them
+        error: add the errors of the retrieval and the passive ozone
+            'linear' as the scripts, or in 'quadrature'
+
+    Returns:
+        (n_isopleths, n_retrievals) arrays as from ozone_loss. With
+        pairing 'all' the 'theta', 'pressure' and 'N2O' are means over
+        the MLS profiles, and 'count' has the number of profiles used.
+        With pairing 'nearest' 'index' has the isopleth level and 'mls'
+        the index of the MLS profile used
+    """
+    x_phys = np.asarray(x_phys, dtype=np.float64)
+    sigma = np.sqrt(np.diagonal(np.asarray(s_phys), axis1=1, axis2=2))
+    match pairing:
+        case "all":
+            result = _all_same_day(loss, mls_dt, m2_dt, x_phys, sigma)
+        case "nearest":
+            result = _nearest_same_day(loss, mls_dt, m2_dt, x_phys, sigma)
+        case _:
+            raise ValueError(f"Unknown MLS pairing {pairing}")
+
+    result.loss = result.passive - result.O3
+    match error:
+        case "linear":
+            result.loss_err = result.O3_err + result.passive_err
+        case "quadrature":
+            result.loss_err = np.sqrt(result.O3_err**2 + result.passive_err**2)
+        case _:
+            raise ValueError(f"Unknown error combination {error}")
+
+    _mask_invalid(result)
+    return result
+
+
+def _nearest_same_day(loss, mls_dt, m2_dt, x_phys, sigma) -> SimpleNamespace:
+    nearest, same_day = nearest_same_day(mls_dt, m2_dt)
+    valid = loss.valid[:, nearest] & same_day
+    index = np.where(valid, loss.index[:, nearest], 0)
+    rows = np.arange(x_phys.shape[0])
+
+    result = SimpleNamespace(
+        isopleths=loss.isopleths,
+        valid=valid,
+        mls=nearest,
+        index=np.where(valid, index, -1),
+        O3=x_phys[rows, index],
+        O3_err=sigma[rows, index],
+    )
+    for name in ("theta", "pressure", "N2O", "passive", "passive_err"):
+        setattr(result, name, getattr(loss, name)[:, nearest].copy())
+    return result
+
+
+def _all_same_day(loss, mls_dt, m2_dt, x_phys, sigma) -> SimpleNamespace:
+    # the MLS profiles of a date are a contiguous run of the sorted
+    # datetimes, every retrieval is paired with the run of its date
+    mls_day = np.asarray(mls_dt, dtype="datetime64[us]").astype("datetime64[D]")
+    m2_day = np.asarray(m2_dt, dtype="datetime64[us]").astype("datetime64[D]")
+    first = np.searchsorted(mls_day, m2_day, side="left")
+    counts = np.searchsorted(mls_day, m2_day, side="right") - first
+    retrieval = np.repeat(np.arange(len(m2_day)), counts)
+    offset = np.arange(len(retrieval)) - np.repeat(np.cumsum(counts) - counts, counts)
+    profile = np.repeat(first, counts) + offset
+
+    valid = loss.valid[:, profile]
+    index = np.where(valid, loss.index[:, profile], 0)
+    values = {
+        "O3": x_phys[retrieval, index],
+        "O3_err": sigma[retrieval, index],
+    }
+    for name in ("theta", "pressure", "N2O", "passive", "passive_err"):
+        values[name] = getattr(loss, name)[:, profile]
+
+    n = len(m2_day)
+    count = np.array([np.bincount(retrieval, weights=v, minlength=n) for v in valid])
+    result = SimpleNamespace(
+        isopleths=loss.isopleths,
+        valid=count > 0,
+        count=count.astype(int),
+    )
+    with np.errstate(invalid="ignore"):
+        for name, value in values.items():
+            value = np.where(valid, value, 0.0)
+            total = [np.bincount(retrieval, weights=v, minlength=n) for v in value]
+            setattr(result, name, np.array(total) / count)
+    return result
+
+
+def loss_product(dts: NDArray, loss: SimpleNamespace) -> dict:
+    """Function to make a product of the ozone loss keyed by datetime
+
+    Args:
+        dts: datetimes of the profiles
+        loss: the loss from ozone_loss or mira2_loss
+
+    Returns:
+        dictionary with the values of every isopleth keyed by datetime
+    """
+    fields = [name for name in vars(loss) if name not in ("isopleths", "mls")]
+    product = {}
+    for j, dt in enumerate(dts):
+        record = {"isopleths": loss.isopleths}
+        record.update({name: getattr(loss, name)[:, j] for name in fields})
+        product[dt] = record
+    return product
+
+
+class OzoneLoss:
+    def __init__(
+        self,
+        fit,
+        isopleths,
+        logger,
+        coordinate="n2o",
+        n2o=None,
+        o3=None,
+        vortex=None,
+        mira2=None,
+        period=None,
+        ensemble=False,
+        joint=None,
+        pairing="all",
+        error="linear",
+    ):
+        ddir = get_downloadsdir()
+        self.logger = logger
+        self.fit_file = Path(fit)
+        self.n2o_file = Path(n2o or ddir / "N2O_tracers_screened_matched.npy")
+        self.o3_file = Path(o3 or ddir / "O3_tracers_screened_matched.npy")
+        self.joint_file = None
+        if joint:
+            self.joint_file = ddir / JOINT_TRACERS if joint is True else Path(joint)
+        self.vortex_file = Path(vortex or ddir / "dmpdata.npy")
+        self.mira2_file = None if mira2 is None else Path(mira2)
+        self.isopleths = np.asarray(isopleths, dtype=np.float64)
+        self.coordinate = coordinate
+        self.period = period
+        self.ensemble = ensemble
+        self.pairing = pairing
+        self.error = error
+
+        self.read_data()
+        if len(self.dt) == 0:
+            self.logger.error("No MLS profiles with N2O, O3 and vortex data")
+            return
+        self.calculate_loss()
+        self.save_loss()
+
+    def read_data(self):
+        self.fitparams = dict(np.load(self.fit_file))
+        self.pressure = np.load(get_datadir() / "m2pres.npz")["pressure"]
+        vortex = np.load(self.vortex_file, allow_pickle=True).item()
+        if self.joint_file is not None:
+            newer = newer_tracers(["N2O", "O3"], self.joint_file)
+            if newer:
+                names = ", ".join(path.name for path in newer)
+                self.logger.warning(
+                    f"{self.joint_file} is older than {names}, "
+                    "using the matched tracer files instead"
+                )
+                self.joint_file = None
+
+        if self.joint_file is not None:
+            self.logger.info(f"Using the joint tracers in {self.joint_file}")
+            self.read_joint(vortex)
+        else:
+            self.logger.info(f"Using the matched tracers in {self.o3_file}")
+            self.read_matched(vortex)
+        dts = list(self.dt)
+        self.theta = np.array([vortex[dt]["theta_interp"] for dt in dts])
+        self.inside = np.array([vortex[dt]["edgemask"] for dt in dts], dtype=bool)
+
+        self.mira2 = None
+        if self.mira2_file is not None:
+            mira2 = load_product(self.mira2_file)
+            if self.period is not None:
+                mira2 = get_period(mira2, self.period)
+            self.mira2 = mira2
+
+    def read_matched(self, vortex: dict):
+        n2o = load_product(self.n2o_file)
+        o3 = load_product(self.o3_file)
+        if self.period is not None:
+            o3 = get_period(o3, self.period)
+
+        dts = sorted(dt for dt in o3 if dt in n2o and dt in vortex)
+        self.dt = np.array(dts)
+        self.n2o = np.array([n2o[dt]["N2O_interp"] for dt in dts])
+        self.o3 = np.array([o3[dt]["O3_interp"] for dt in dts])
+        self.o3_err = np.array([o3[dt]["precision_interp"] for dt in dts])
+
+    def read_joint(self, vortex: dict):
+        dts = sorted(vortex)
+        if self.period is not None:
+            dts = sorted(get_period(dict.fromkeys(dts), self.period))
+
+        found, profiles = interp_joint(
+            ["N2O", "O3"], dts, self.pressure, self.joint_file
+        )
+        self.dt = np.array([dt for dt, ok in zip(dts, found) if ok])
+        self.n2o = profiles["N2O"]
+        self.o3 = profiles["O3"]
+        self.o3_err = profiles["O3_precision"]
+
+    def calculate_loss(self):
+        self.mls_loss = ozone_loss(
+            n2o=self.n2o,
+            o3=self.o3,
+            o3_err=self.o3_err,
+            theta=self.theta,
+            pressure=self.pressure,
+            inside=self.inside,
+            fitparams=self.fitparams,
+            isopleths=self.isopleths,
+            coordinate=self.coordinate,
+            ensemble=self.ensemble,
+        )
+        found = np.count_nonzero(self.mls_loss.valid, axis=1)
+        self.logger.info(f"MLS profiles reaching each isopleth: {found.tolist()}")
+
+        self.m2_loss = None
+        if self.mira2 is not None:
+            m2_dt = np.array([dt for dt in self.mira2.keys()])
+            self.m2_dt = m2_dt
+            self.m2_loss = mira2_loss(
+                loss=self.mls_loss,
+                mls_dt=self.dt,
+                m2_dt=m2_dt,
+                x_phys=np.array([v["x_phys"] for v in self.mira2.values()]),
+                s_phys=np.array([v["S_phys"] for v in self.mira2.values()]),
+                pairing=self.pairing,
+                error=self.error,
+            )
+
+    def save_loss(self):
+        outdir = get_downloadsdir()
+        mls_fn = (self.joint_file or self.o3_file).stem + "_loss.npy"
+        product = loss_product(self.dt, self.mls_loss)
+        np.save(outdir / mls_fn, product, allow_pickle=True)
+        self.logger.info(f"Saved MLS ozone loss in {outdir / mls_fn}")
+
+        if self.m2_loss is not None:
+            m2_fn = self.mira2_file.stem + "_loss.npy"
+            product = loss_product(self.m2_dt, self.m2_loss)
+            np.save(outdir / m2_fn, product, allow_pickle=True)
+            self.logger.info(f"Saved MIRA2 ozone loss in {outdir / m2_fn}")
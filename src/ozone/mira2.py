@@ -1,10 +1,14 @@
 from pathlib import Path
 import h5py
 from tqdm import tqdm
+from functools import partial
 import numpy as np
 from datetime import datetime, timedelta
 from .io import get_exportdir, get_datadir
-from .utils import fill_nans
+from .utils import fill_nans, map_ordered
+from .store import save_product, product_path, save_columnar, to_columns, LazyProduct
+
+SPECTRA = ("y", "yf", "residual", "f", "opacity", "transmission")
 
 
 def make_datetime_old(measure: h5py._hl.group.Group) -> datetime:
@@ -68,6 +72,57 @@ def make_datetime_new(measure: h5py._hl.group.Group) -> datetime:
     return mid, delta
 
 
+def read_midtime(measure: h5py._hl.group.Group) -> tuple:
+    """Function to get the middle of a measurement
+
+    Tries the old layout of the measurement times before the new
+
+    Args:
+        measure: dataset containing measurement data
+
+    Returns:
+        middle of the measurement datetime and its duration
+    """
+    try:
+        return make_datetime_old(measure)
+    except KeyError:
+        return make_datetime_new(measure)
+
+
+def catalogue_file(file: Path) -> dict:
+    """Function to make the catalogue entry of a MIRA2 file
+
+    Args:
+        file: path to the MIRA2 file
+
+    Returns:
+        dictionary with the size and mtime of the file, its
+        retrieval groups, the middle and duration of the
+        measurement and the convergence of each retrieval
+    """
+    stat = file.stat()
+    with h5py.File(file, "r") as fh:
+        groups = [key for key in fh.keys() if key != "mira2_data"]
+        try:
+            dt, meastime = read_midtime(fh["mira2_data"])
+        except (KeyError, ValueError):
+            dt, meastime = None, None
+        convergence = {
+            key: fh[key].attrs.get("convergence", np.nan)
+            for key in groups
+            if isinstance(fh[key], h5py.Group)
+        }
+
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "groups": groups,
+        "dt": dt,
+        "meastime": meastime,
+        "convergence": convergence,
+    }
+
+
 def calculate_mr(retrieval: h5py._hl.group.Group) -> np.ndarray:
     """Function to calculate the measurement response
 
@@ -82,10 +137,183 @@ def calculate_mr(retrieval: h5py._hl.group.Group) -> np.ndarray:
     Returns:
         Measurement response
     """
-    mr = []
-    for row in retrieval["avk"][()][0:41, 0:41]:
-        mr.append(sum(row))
-    return np.array(mr)
+    return measurement_response(retrieval["avk"][()][0:41, 0:41])
+
+
+def measurement_response(avk: np.ndarray) -> np.ndarray:
+    """Function to calculate the measurement response
+
+    Sums the rows of one averaging kernel matrix, or of a
+    stack of them. The rows are summed in order, so the
+    results equal the built-in sum over each row
+
+    Args:
+        avk: averaging kernel matrix, or (n, m, m) stack of them
+
+    Returns:
+        Measurement response
+    """
+    return np.cumsum(avk, axis=-1)[..., -1]
+
+
+def physical_units(records: list):
+    """Function to add the physical units to MIRA2 records
+
+    The retrievals are stacked and converted together, with
+    M = 1e6 * diag(apriori) applied by broadcasting instead of
+    dense matrix products. Each record gets the measurement
+    response 'mr', the profile 'x_phys' = M @ x and, if it has
+    covariances, 'S_phys' = M @ (Ss + So) @ M.T. As with the matrix
+    products, a non-finite value in x, or in Ss + So, makes all other
+    values of x_phys, or of S_phys, NaN
+
+    Args:
+        records: dictionaries with the retrieval data, changed in place
+    """
+    groups = {}
+    for record in records:
+        key = (record["x"].shape, record["apriori"].shape, record["avk"].shape)
+        groups.setdefault(key, []).append(record)
+
+    for group in groups.values():
+        m = 1e6 * np.stack([record["apriori"] for record in group])
+        x = np.stack([record["x"] for record in group])
+        mr = measurement_response(np.stack([record["avk"] for record in group]))
+        x_phys = _spread_nonfinite(m * x, x)
+        for record, mr_i, x_i in zip(group, mr, x_phys):
+            record["mr"] = mr_i
+            record["x_phys"] = x_i
+
+        covs = [record for record in group if "Ss" in record]
+        if len(covs) == 0:
+            continue
+        mc = 1e6 * np.stack([record["apriori"] for record in covs])
+        S = np.stack([record["Ss"] + record["So"] for record in covs])
+        S_phys = _spread_nonfinite(mc[:, :, None] * S * mc[:, None, :], S)
+        for record, S_i in zip(covs, S_phys):
+            record["S_phys"] = S_i
+
+
+def _spread_nonfinite(product: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Function to set NaN's where a product with a diagonal matrix has them
+
+    In a product with a diagonal matrix every zero off the diagonal
+    multiplies all values, so a NaN or inf in the values of a profile
+    turns its other elements into NaN
+
+    Args:
+        product: the product computed by broadcasting, changed in place
+        values: the values multiplied with the diagonal matrix
+
+    Returns:
+        the product
+    """
+    finite = np.isfinite(values)
+    axes = tuple(range(1, values.ndim))
+    spread = ~finite.all(axis=axes, keepdims=True) & finite
+    product[spread] = np.nan
+    return product
+
+
+def read_retrieval(file: Path, key: str) -> dict:
+    """Function to extract the products of a MIRA2 file
+
+    Args:
+        file: path to the MIRA2 file
+        key: name of the retrieval group in the file
+
+    Returns:
+        dictionary with the measurement and retrieval data, without
+        the physical units added by physical_units
+    """
+    with h5py.File(file, "r") as f:
+        measure = f["mira2_data"]
+        retrieval = f[key]
+        convergence = retrieval.attrs["convergence"]
+
+        apriori = retrieval["vmr_field"][()][0, :, 0, 0]
+        x = retrieval["x"][()][0:41]
+        try:
+            record = {
+                "file": np.array([file]),
+                "opacity": measure["opacity"][()],
+                "transmission": measure["transmission"][()],
+                "pmeas": measure["p_grid"][()],
+                "zmeas": measure["z_field"][()],
+                "tmeas": measure["t_field"][()],
+                "meastime": measure["meas_duration"][()],
+                "yf": retrieval["yf"][()],
+                "y": retrieval["y"][()],
+                "residual": retrieval["y"][()] - retrieval["yf"][()],
+                "f": retrieval["f_backend"][()],
+                "avk": retrieval["avk"][()][0:41, 0:41],
+                "pgrid": retrieval["p_grid"][()],
+                "zgrid": retrieval["z_field"][()][:, 0, 0],
+                "eo": retrieval["retrieval_eo"][()][0:41],
+                "ss": retrieval["retrieval_ss"][()][0:41],
+                "x": x,
+                "apriori": apriori,
+                "convergence": convergence,
+            }
+        except KeyError:
+            _, meastime = read_midtime(measure)
+            record = {
+                "file": np.array([file]),
+                "pmeas": measure["p_grid"][()],
+                "zmeas": measure["z_field"][()],
+                "tmeas": measure["t_field"][()],
+                "yf": retrieval["yf"][()],
+                "y": retrieval["y"][()],
+                "residual": retrieval["y"][()] - retrieval["yf"][()],
+                "f": retrieval["f_backend"][()],
+                "avk": retrieval["avk"][()][0:41, 0:41],
+                "pgrid": retrieval["p_grid"][()],
+                "zgrid": retrieval["z_field"][()][:, 0, 0],
+                "eo": retrieval["retrieval_eo"][()][0:41],
+                "ss": retrieval["retrieval_ss"][()][0:41],
+                "x": x,
+                "apriori": apriori,
+                "convergence": convergence,
+                "meastime": np.array(meastime),
+            }
+            if (
+                "covmat_ss" in retrieval.keys()
+                and "covmat_so" in retrieval.keys()
+            ):
+                Ss = retrieval["covmat_ss"][()][0:41, 0:41]
+                So = retrieval["covmat_so"][()][0:41, 0:41]
+                record["Ss"] = Ss
+                record["So"] = So
+    return record
+
+
+def split_spectra(record: dict) -> dict:
+    """Function to split the spectra from a MIRA2 record
+
+    The spectra are removed from the record, which instead gets the
+    extrema of the residual used in the screening
+
+    Args:
+        record: dictionary with the measurement and retrieval data
+
+    Returns:
+        dictionary with the spectra of the record
+    """
+    record["residual_max"] = record["residual"].max()
+    record["residual_min"] = record["residual"].min()
+    return {key: record.pop(key) for key in SPECTRA if key in record}
+
+
+def open_spectra(dataset: str) -> LazyProduct:
+    """Function to open the spectra split from a MIRA2 product
+
+    Args:
+        dataset: name of the retrieval group of the product
+
+    Returns:
+        the spectra keyed by datetime, read on demand
+    """
+    return LazyProduct(get_exportdir() / f"{dataset}.spectra.h5")
 
 
 class MIRA2FindAndMake:
@@ -95,19 +323,42 @@ class MIRA2FindAndMake:
     retrieval data.
     """
 
-    def __init__(self, root: str, make: bool, logger, dataset):
+    def __init__(
+        self,
+        root: str,
+        make: bool,
+        logger,
+        dataset,
+        store: str = "npy",
+        workers: int = 1,
+        split: bool = False,
+        reuse: bool = False,
+    ):
         """Init constructor
 
         Args:
             root: Path to the directory with MIRA2 files
             make: Boolean if files should be created
+            logger: Logger object
+            dataset: Name of the retrieval group in the files
+            store: Store of the product, 'npy' or 'h5', see store.py
+            workers: Number of processes used to read the files
+            split: Boolean if the spectra should be kept in a
+                separate file, see split_spectra
+            reuse: Boolean if an up to date product should be kept,
+                see is_current
         """
         self.KEY = dataset
+        self.store = store
+        self.workers = workers
+        self.split = split
         self.root = Path(root).resolve()
         self.find_mira2()
         self.logger = logger
 
-        if make:
+        if make and reuse and self.is_current():
+            self.logger.info(f"MIRA2 {self.KEY} product is up to date, reusing it")
+        elif make:
             self.makeproducts()
 
     def find_mira2(self):
@@ -119,17 +370,109 @@ class MIRA2FindAndMake:
         retrieval have converged from the metadata written
         to the file.
         """
-        self.files = self.root.rglob(pattern="*.hdf5")
-        retfiles = []
-
-        for file in tqdm(self.files, desc="Finding files with retrieval"):
-            with h5py.File(file, "r") as fh:
-                if self.KEY in fh.keys():
-                    retfiles.append(file.resolve())
+        self.files = sorted(
+            file.resolve() for file in self.root.rglob(pattern="*.hdf5")
+        )
+        self.update_catalogue()
 
-        retfiles = np.array(sorted(retfiles))
+        retfiles = [
+            file
+            for file in self.files
+            if self.KEY in self.catalogue[str(file)]["groups"]
+        ]
+        retfiles = np.array(retfiles)
         self.retfiles = retfiles
 
+    def update_catalogue(self):
+        """Method to update the catalogue of MIRA2 files
+
+        The catalogue is kept in the export directory under
+        'mira2.catalogue.npy', with an entry from catalogue_file
+        for every file keyed by its path. Only files that are new
+        or have changed size or mtime since they were catalogued
+        are opened, and files removed from the root are dropped
+        """
+        catpath = get_exportdir() / "mira2.catalogue.npy"
+        if catpath.exists():
+            catalogue = np.load(catpath, allow_pickle=True).item()
+        else:
+            catalogue = {}
+
+        found = {str(file) for file in self.files}
+        removed = [
+            path
+            for path in catalogue
+            if Path(path).is_relative_to(self.root) and path not in found
+        ]
+        for path in removed:
+            del catalogue[path]
+
+        toread = []
+        for file in self.files:
+            entry = catalogue.get(str(file))
+            stat = file.stat()
+            if (
+                entry is None
+                or entry["size"] != stat.st_size
+                or entry["mtime"] != stat.st_mtime_ns
+            ):
+                toread.append(file)
+
+        entries = map_ordered(catalogue_file, toread, self.workers)
+        for file, entry in zip(
+            toread, tqdm(entries, total=len(toread), desc="Cataloguing files")
+        ):
+            catalogue[str(file)] = entry
+
+        if toread or removed:
+            np.save(catpath, catalogue, allow_pickle=True)
+        self.catalogue = catalogue
+
+    def make_params(self) -> dict:
+        """Method to get the parameters the product is made with
+
+        Returns:
+            dictionary with the parameters
+        """
+        daterange = np.load(get_datadir() / "daterange.npy", allow_pickle=True)
+        return {"start": daterange[0], "end": daterange[-1], "split": self.split}
+
+    def file_stats(self) -> dict:
+        """Method to get the size and mtime of the files with retrievals
+
+        Returns:
+            dictionary with the size and mtime keyed by path
+        """
+        return {
+            str(file): {
+                "size": self.catalogue[str(file)]["size"],
+                "mtime": self.catalogue[str(file)]["mtime"],
+            }
+            for file in self.retfiles
+        }
+
+    def is_current(self) -> bool:
+        """Method to check if the product is up to date
+
+        The product is up to date if its meta file records the same
+        parameters and the same files, with unchanged size and mtime,
+        as a new product would be made with
+
+        Returns:
+            if the product is up to date
+        """
+        edir = get_exportdir()
+        metapath = edir / f"{self.KEY}.meta.npy"
+        savepath = product_path(edir / self.KEY, self.store)
+        if not metapath.exists() or not savepath.exists():
+            return False
+
+        meta = np.load(metapath, allow_pickle=True).item()
+        return (
+            meta.get("params") == self.make_params()
+            and meta.get("files") == self.file_stats()
+        )
+
     def makeproducts(self):
         """Method to create new files
 
@@ -150,88 +493,44 @@ class MIRA2FindAndMake:
         end = daterange[-1]
         mdict = {}
 
-        for file in tqdm(self.retfiles, desc="Extracting products"):
-            with h5py.File(file, "r") as f:
-                measure = f["mira2_data"]
-                retrieval = f[self.KEY]
-                convergence = retrieval.attrs["convergence"]
-
-                try:
-                    dt, _ = make_datetime_old(measure)
-                except KeyError:
-                    dt, meastime = make_datetime_new(measure)
-
-                if start <= dt.date() <= end:
-                    apriori = retrieval["vmr_field"][()][0, :, 0, 0]
-                    D = np.diag(apriori)
-                    M = 1e6 * D
-                    x = retrieval["x"][()][0:41]
-                    try:
-                        mdict[dt] = {
-                            "file": np.array([file]),
-                            "opacity": measure["opacity"][()],
-                            "transmission": measure["transmission"][()],
-                            "pmeas": measure["p_grid"][()],
-                            "zmeas": measure["z_field"][()],
-                            "tmeas": measure["t_field"][()],
-                            "meastime": measure["meas_duration"][()],
-                            "yf": retrieval["yf"][()],
-                            "y": retrieval["y"][()],
-                            "residual": retrieval["y"][()] - retrieval["yf"][()],
-                            "f": retrieval["f_backend"][()],
-                            "avk": retrieval["avk"][()][0:41, 0:41],
-                            "mr": calculate_mr(retrieval),
-                            "pgrid": retrieval["p_grid"][()],
-                            "zgrid": retrieval["z_field"][()][:, 0, 0],
-                            "eo": retrieval["retrieval_eo"][()][0:41],
-                            "ss": retrieval["retrieval_ss"][()][0:41],
-                            "x": x,
-                            "x_phys": M @ x,
-                            "apriori": apriori,
-                            "convergence": convergence,
-                        }
-                    except KeyError:
-                        mdict[dt] = {
-                            "file": np.array([file]),
-                            "pmeas": measure["p_grid"][()],
-                            "zmeas": measure["z_field"][()],
-                            "tmeas": measure["t_field"][()],
-                            "yf": retrieval["yf"][()],
-                            "y": retrieval["y"][()],
-                            "residual": retrieval["y"][()] - retrieval["yf"][()],
-                            "f": retrieval["f_backend"][()],
-                            "avk": retrieval["avk"][()][0:41, 0:41],
-                            "mr": calculate_mr(retrieval),
-                            "pgrid": retrieval["p_grid"][()],
-                            "zgrid": retrieval["z_field"][()][:, 0, 0],
-                            "eo": retrieval["retrieval_eo"][()][0:41],
-                            "ss": retrieval["retrieval_ss"][()][0:41],
-                            "x": x,
-                            "x_phys": M @ x,
-                            "apriori": apriori,
-                            "convergence": convergence,
-                            "meastime": np.array(meastime),
-                        }
-                        if (
-                            "covmat_ss" in retrieval.keys()
-                            and "covmat_so" in retrieval.keys()
-                        ):
-                            Ss = retrieval["covmat_ss"][()][0:41, 0:41]
-                            So = retrieval["covmat_so"][()][0:41, 0:41]
-                            S = Ss + So
-                            mdict[dt]["Ss"] = Ss
-                            mdict[dt]["So"] = So
-                            mdict[dt]["S_phys"] = M @ S @ M.transpose()
+        retfiles = []
+        for file in self.retfiles:
+            entry = self.catalogue[str(file)]
+            if entry["dt"] is None:
+                self.logger.warning(f"Could not read the measurement time of {file}")
+            elif start <= entry["dt"].date() <= end:
+                retfiles.append(file)
+
+        dts = [self.catalogue[str(file)]["dt"] for file in retfiles]
+        records = map_ordered(
+            partial(read_retrieval, key=self.KEY), retfiles, self.workers
+        )
+        # files are merged in order, so a later file with the same
+        # datetime replaces the earlier one
+        for dt, record in zip(
+            dts, tqdm(records, total=len(retfiles), desc="Extracting products")
+        ):
+            mdict[dt] = record
+        physical_units(list(mdict.values()))
+
+        if self.split:
+            spectra = {dt: split_spectra(mdict[dt]) for dt in sorted(mdict)}
+            spectrapath = edir / f"{self.KEY}.spectra.h5"
+            save_columnar(spectrapath, to_columns(spectra), chunked=True)
+            self.logger.info(f"Saved spectra into {spectrapath}")
 
         sdict = fill_nans(mdict)
-        savepath = edir / f"{self.KEY}.npy"
         metapath = edir / f"{self.KEY}.meta.npy"
         mdict = {
             "product": "mira2",
             "make_date": datetime.now(),
             "sources": self.retfiles,
+            "params": self.make_params(),
+            "files": self.file_stats(),
         }
+        if self.split:
+            mdict["spectra"] = spectrapath
 
-        np.save(savepath, sdict, allow_pickle=True)
+        savepath = save_product(edir / self.KEY, sdict, self.store)
         np.save(metapath, mdict, allow_pickle=True)
         self.logger.info(f"Saved measurement and retrieval data into {savepath}")
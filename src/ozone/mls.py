@@ -1,39 +1,376 @@
 from pathlib import Path
+import re
 import h5py
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime, date
 from tqdm import tqdm
+from functools import partial
+from typing import Callable, Iterator
 from .io import get_exportdir, get_datadir, get_downloadsdir
 from .logger import get_logger
-from .utils import fill_nans
-from haversine import haversine, Unit
+from .utils import fill_nans, map_ordered
+from haversine import haversine_vector, Unit
 from .screening import MLSScreener
+from .rules import compile_screen, apply_rules
+from .store import save_product, load_product, product_path, STORES
+from .store import ColumnarProduct, save_columnar, load_columnar
 import logging
 import yaml
 
 
-def make_datetime(seconds_array: np.ndarray) -> datetime:
-    """Function to create datetime objects
+KIRUNA = (67.84, 20.41)
+TAI93 = np.datetime64("1993-01-01T00:00:00", "s")
+TAI93_MAX = (datetime(9999, 12, 31, 23, 59, 59) - datetime(1993, 1, 1)).total_seconds()
+JOINT_TRACERS = "MLS_tracers_joint.h5"
+
+
+def make_datetime(seconds_array: np.ndarray) -> np.ndarray:
+    """Function to create datetime64 objects
 
     This function takes the data in the 'TIME' field from
-    the .he5 MLS files and converts the time to a datetime
-    object and returns a numpy ndarray with these datetime
-    objects
+    the .he5 MLS files, which is seconds since 1993-01-01,
+    and converts all times at once to datetime64 with a
+    resolution of seconds. Fractions of seconds are truncated.
+    Values before the epoch (fill values) or values that can
+    not be represented as a datetime are set to NaT
 
     Args:
         seconds_array: array associated with the 'TIME' field
 
     Returns:
-        numpy array with datetime objects
+        numpy array with datetime64[s]
+    """
+    seconds = np.asarray(seconds_array, dtype=np.float64)
+    valid = np.isfinite(seconds) & (seconds >= 0) & (seconds <= TAI93_MAX)
+    seconds = np.where(valid, seconds, 0.0)
+
+    # round to microseconds before truncating, as timedelta does
+    whole = np.floor(seconds)
+    micro = np.rint((seconds - whole) * 1e6)
+    whole = whole + (micro >= 1e6)
+
+    dt = TAI93 + whole.astype(np.int64).astype("timedelta64[s]")
+    return np.where(valid, dt, np.datetime64("NaT", "s"))
+
+
+def select_profiles(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    dt: np.ndarray,
+    loc: tuple,
+    radii: float,
+    start: date,
+    end: date,
+) -> np.ndarray:
+    """Function to select the profiles close to a location
+
+    This function computes the great-circle distance from the
+    location to every profile in a granule at once and combines
+    it with the date window. Profiles with latitudes outside of
+    [-90, 90] (fill values) are never selected
+
+    Args:
+        lat: array with the latitudes of the profiles
+        lon: array with the longitudes of the profiles
+        dt: array with the datetimes of the profiles
+        loc: (latitude, longitude) of the location
+        radii: maximum distance from the location in kilometers
+        start: first date of the window
+        end: last date of the window
+
+    Returns:
+        boolean mask with the selected profiles
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    valid = (lat <= 90) & (lat >= -90)
+
+    points = np.column_stack((np.where(valid, lat, 0.0), lon))
+    distance = haversine_vector(
+        loc,
+        points,
+        unit=Unit.KILOMETERS,
+        comb=True,
+        check=False,
+    ).ravel()
+
+    mask = valid & (distance <= radii)
+
+    # only the profiles within the radius need their date checked
+    dates = dt[mask].astype("datetime64[D]")
+    window = (dates >= np.datetime64(start)) & (dates <= np.datetime64(end))
+    mask[mask] = window
+    return mask
+
+
+def select_box(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    dt: np.ndarray,
+    latbound: tuple,
+    lonbound: tuple,
+    start: date,
+    end: date,
+) -> np.ndarray:
+    """Function to select the profiles within a latitude/longitude box
+
+    Args:
+        lat: array with the latitudes of the profiles
+        lon: array with the longitudes of the profiles
+        dt: array with the datetimes of the profiles
+        latbound: (max, min) latitude of the box
+        lonbound: (min, max) longitude of the box
+        start: first date of the window
+        end: last date of the window
+
+    Returns:
+        boolean mask with the selected profiles
+    """
+    latmax, latmin = latbound
+    lonmin, lonmax = lonbound
+    mask = (lat >= latmin) & (lat <= latmax) & (lon >= lonmin) & (lon <= lonmax)
+
+    dates = dt[mask].astype("datetime64[D]")
+    window = (dates >= np.datetime64(start)) & (dates <= np.datetime64(end))
+    mask[mask] = window
+    return mask
+
+
+def get_data(datafields: h5py.Group, name: str, index: np.ndarray) -> dict:
+    """Function to get the selected data from data fields
+
+    This is a helper function used to extract all the necessary
+    data from 'Data Fields' in the MLS file. Only the rows given
+    by index are read from the file
+
+    Args:
+        datafields: dataset with data fields
+        name: name of the MLS product
+        index: increasing indices of the profiles to read
+
+    Returns:
+        dictionary with the data fields
     """
-    epoch = datetime(1993, 1, 1, 0, 0, 0)
-    dtarr = []
+    return {
+        "prod": datafields[name][index],
+        "convergence": datafields["Convergence"][index],
+        "l2_precision": datafields["L2gpPrecision"][index],
+        "l2_value": datafields["L2gpValue"][index],
+        "precision": datafields[f"{name}Precision"][index],
+        "quality": datafields["Quality"][index],
+        "status": datafields["Status"][index],
+    }
+
 
-    for sec in seconds_array:
-        dt = epoch + timedelta(seconds=sec)
-        dt = dt.replace(microsecond=0)
-        dtarr.append(dt)
-    return np.array(dtarr)
+def get_geoloc(geolocfields: h5py.Group) -> dict:
+    """Function to get all data from geo-location fields
+
+    Helper function to extract the necessary data from the
+    'Geolocation Fields' in the MLS file
+
+    Args:
+        geolocfields: dataset with geolocation fields
+
+    Returns:
+        dictionary with the geolocation fields
+    """
+    time = geolocfields["Time"][()]
+    return {
+        "lat": geolocfields["Latitude"][()],
+        "lon": geolocfields["Longitude"][()],
+        "p_grid": geolocfields["Pressure"][()],
+        "time": time,
+        "dt": make_datetime(time),
+    }
+
+
+def read_granule(file: Path, name: str, select: Callable) -> list:
+    """Function to read the selected profiles from one MLS granule
+
+    The geolocation fields are read first and used to select the
+    profiles, after which only the selected rows of the data fields
+    are read from the file
+
+    Args:
+        file: path to the .he5 file
+        name: name of the MLS product
+        select: function taking (lat, lon, dt) and returning a
+            boolean mask with the profiles to keep
+
+    Returns:
+        list with (datetime, profile) tuples in the order of the granule
+    """
+    profiles = []
+    with h5py.File(file, "r") as fh:
+        prod = fh["HDFEOS"]["SWATHS"][name]
+        geoloc = get_geoloc(prod["Geolocation Fields"])
+
+        index = np.flatnonzero(select(geoloc["lat"], geoloc["lon"], geoloc["dt"]))
+        if len(index) == 0:
+            return profiles
+
+        data = get_data(prod["Data Fields"], name, index)
+        dts = geoloc["dt"][index].astype(datetime)
+        for j, i in enumerate(index):
+            profile = {
+                f"{name}": data["prod"][j],
+                "convergence": data["convergence"][j],
+                "l2precision": data["l2_precision"][j],
+                "l2value": data["l2_value"][j],
+                "precision": data["precision"][j],
+                "quality": data["quality"][j],
+                "status": data["status"][j],
+                "lat": geoloc["lat"][i],
+                "lon": geoloc["lon"][i],
+                "pressure": geoloc["p_grid"],
+                "time": geoloc["time"][i],
+            }
+            profiles.append((dts[j], profile))
+    return profiles
+
+
+def read_granules(
+    files: list, name: str, select: Callable, workers: int = 1
+) -> Iterator[list]:
+    """Function to read many MLS granules
+
+    Args:
+        files: sorted list with the .he5 files
+        name: name of the MLS product
+        select: function used to select profiles, see read_granule
+        workers: number of worker processes, see utils.map_ordered
+
+    Returns:
+        iterator with the profiles of each granule, in the order of files
+    """
+    read = partial(read_granule, name=name, select=select)
+    yield from map_ordered(read, files, workers)
+
+
+def granule_day(file: Path) -> str:
+    """Function to get the day of a MLS granule
+
+    Args:
+        file: path to the .he5 file
+
+    Returns:
+        the 'yyyydddd' part of the file name, or the file name
+        if it has none
+    """
+    match = re.search(r"\d{4}d\d{3}", file.name)
+    return match.group() if match else file.stem
+
+
+def read_joint_granules(files: dict, select: Callable) -> dict:
+    """Function to read the selected profiles of several products for one day
+
+    All MLS L2 products share the same along-track geolocation, so
+    the profiles are selected once from the geolocation of the first
+    product. The other products are aligned to these profiles by their
+    'Time', and only the selected rows are read. Profiles missing in a
+    product are set to NaN
+
+    Args:
+        files: product name mapped to the .he5 file of that product
+        select: function taking (lat, lon, dt) and returning a
+            boolean mask with the profiles to keep
+
+    Returns:
+        dictionary with 'dt', 'time', 'lat' and 'lon' of the selected
+        profiles and, for every product, the product name mapped to a
+        dictionary with its aligned fields and 'pressure'
+    """
+    names = list(files)
+    with h5py.File(files[names[0]], "r") as fh:
+        geoloc = get_geoloc(fh["HDFEOS"]["SWATHS"][names[0]]["Geolocation Fields"])
+
+    index = np.flatnonzero(select(geoloc["lat"], geoloc["lon"], geoloc["dt"]))
+    time = geoloc["time"][index]
+    joint = {
+        "dt": geoloc["dt"][index],
+        "time": time,
+        "lat": geoloc["lat"][index],
+        "lon": geoloc["lon"][index],
+    }
+
+    for name in names:
+        with h5py.File(files[name], "r") as fh:
+            prod = fh["HDFEOS"]["SWATHS"][name]
+            geolocfields = prod["Geolocation Fields"]
+            ptime = geolocfields["Time"][()]
+            pressure = geolocfields["Pressure"][()]
+
+            if np.array_equal(ptime, geoloc["time"]):
+                found = np.ones(len(index), dtype=bool)
+                pindex = index
+            else:
+                order = np.argsort(ptime)
+                pos = np.searchsorted(ptime[order], time).clip(max=len(ptime) - 1)
+                found = ptime[order][pos] == time
+                pindex = order[pos[found]]
+
+            # h5py needs increasing indices
+            rows, inverse = np.unique(pindex, return_inverse=True)
+            if len(rows) > 0:
+                data = get_data(prod["Data Fields"], name, rows)
+
+        fields = {"pressure": pressure}
+        for key in ("l2_value", "precision", "status", "quality", "convergence"):
+            levels = (len(pressure),) if key in ("l2_value", "precision") else ()
+            aligned = np.full((len(index), *levels), np.nan)
+            if len(rows) > 0:
+                aligned[found] = data[key][inverse]
+            fields[key] = aligned
+        joint[name] = fields
+
+    return joint
+
+
+def load_joint_tracers(names: list, path: Path | None = None) -> ColumnarProduct:
+    """Function to load the tracers made with 'tracersmake --joint'
+
+    The tracers share the time index of the file, so only the profiles
+    passing the screening of all given tracers are kept and the columns
+    of the tracers stay aligned
+
+    Args:
+        names: product names of the tracers, e.g. ['N2O', 'O3']
+        path: path of the .h5 file, the joint file in the downloads
+            directory by default
+
+    Returns:
+        the columnar product with the profiles passing all screenings
+    """
+    path = Path(path or get_downloadsdir() / JOINT_TRACERS)
+    product = load_columnar(path)
+    screened = [product.columns[f"{name}_screened"] for name in names]
+    return product.select(np.logical_and.reduce(screened))
+
+
+def newer_tracers(names: list, path: Path | None = None) -> list:
+    """Function to find the tracer products made after the joint tracer file
+
+    Args:
+        names: product names of the tracers, e.g. ['N2O', 'O3']
+        path: path of the joint tracer file, the joint file in the
+            downloads directory by default
+
+    Returns:
+        the screened tracer products in the downloads directory that
+        were modified after the joint tracer file
+    """
+    path = Path(path or get_downloadsdir() / JOINT_TRACERS)
+    mtime = path.stat().st_mtime_ns
+    products = [
+        product_path(get_downloadsdir() / f"{name}_tracer_screened", store)
+        for name in names
+        for store in STORES
+    ]
+    return [
+        product
+        for product in products
+        if product.exists() and product.stat().st_mtime_ns > mtime
+    ]
 
 
 class MLSFindAndMake:
@@ -41,23 +378,42 @@ class MLSFindAndMake:
     Find MLS files and make .npy file from these
     """
 
-    def __init__(self, root: str, logger):
+    def __init__(
+        self,
+        root: str,
+        logger,
+        workers: int = 1,
+        incremental: bool = False,
+        store: str = "npy",
+        reuse: bool = False,
+    ):
         """Init constructor
 
         Args:
             root: Root directory for the MLS files
-            make: Boolean is a file will be made
-            radii: Geographical radius from Kiruna
+            logger: Logger object
+            workers: Number of processes used to read the files
+            incremental: Only read files that are new or changed since
+                the last run and merge them into the existing product
+            store: Store of the product, 'npy' or 'h5', see store.py
+            reuse: Keep the existing product if it is up to date with
+                the files, see is_current
         """
         self.root = Path(root).resolve()
         self.name = self.root.name
         if self.name == "T":
             self.name = "Temperature"
-        self.loc = (67.84, 20.41)
+        self.loc = KIRUNA
         self.radii = 400
+        self.workers = workers
+        self.incremental = incremental
+        self.store = store
         self.logger = logger
         self.find_mls()
-        self.make_mls()
+        if reuse and self.is_current():
+            self.logger.info(f"MLS {self.name} product is up to date, reusing it")
+        else:
+            self.make_mls()
 
     def find_mls(self):
         """Method to find the files
@@ -68,68 +424,145 @@ class MLSFindAndMake:
         files = self.root.rglob(pattern="*.he5")
         self.files = sorted([file for file in files])
 
+    def make_params(self) -> dict:
+        """Method to get the parameters the product is made with
+
+        Returns:
+            dictionary with the parameters
+        """
+        daterange = np.load(get_datadir() / "daterange.npy", allow_pickle=True)
+        return {
+            "loc": self.loc,
+            "radii": self.radii,
+            "start": daterange[0],
+            "end": daterange[-1],
+        }
+
+    def load_manifest(self) -> dict | None:
+        """Method to load the manifest of the previous run
+
+        The manifest is only returned if it was made with the same
+        parameters and the product it describes still exists
+
+        Returns:
+            the manifest, or None if it can not be used
+        """
+        edir = get_exportdir()
+        manifestpath = edir / f"{self.name}.manifest.npy"
+        savepath = product_path(edir / self.name, self.store)
+
+        if not manifestpath.exists() or not savepath.exists():
+            return None
+
+        manifest = np.load(manifestpath, allow_pickle=True).item()
+        if manifest["params"] != self.make_params():
+            self.logger.info("Make parameters changed since the last run")
+            return None
+        return manifest
+
+    def file_stats(self) -> dict:
+        """Method to get the size and mtime of the files
+
+        Returns:
+            dictionary with the size and mtime keyed by path
+        """
+        stats = {}
+        for file in self.files:
+            stat = file.stat()
+            stats[str(file)] = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+        return stats
+
+    def is_current(self) -> bool:
+        """Method to check if the product is up to date
+
+        The product is up to date if it was made with the same
+        parameters from the same files, with unchanged size and
+        mtime, as the manifest of the last run records
+
+        Returns:
+            if the product is up to date
+        """
+        manifest = self.load_manifest()
+        if manifest is None:
+            return False
+
+        stats = self.file_stats()
+        granules = manifest["granules"]
+        return stats.keys() == granules.keys() and all(
+            granules[path]["size"] == stat["size"]
+            and granules[path]["mtime"] == stat["mtime"]
+            for path, stat in stats.items()
+        )
+
     def make_mls(self):
         """Method to make the .npy file
 
         This method extracts all necessary datasets to do a proper
         analysis using MLS data. It also employs the haversine function
         to limit the data so only data within a certain radii from Kiruna
-        will be extracted
+        will be extracted.
+
+        Alongside the product a manifest is saved with the size, mtime
+        and extracted profiles of every file. In incremental mode the
+        profiles of unchanged files are taken from the existing product
+        and only new or changed files are read
         """
         files = []
         umlsdct = {}
         edir = get_exportdir()
-        ddir = get_datadir()
-        daterange = np.load(ddir / "daterange.npy", allow_pickle=True)
-        start = daterange[0]
-        end = daterange[-1]
+        params = self.make_params()
+        select = partial(
+            select_profiles,
+            loc=params["loc"],
+            radii=params["radii"],
+            start=params["start"],
+            end=params["end"],
+        )
+        metapath = edir / f"{self.name}.meta.npy"
+        manifestpath = edir / f"{self.name}.manifest.npy"
+
+        stats = self.file_stats()
+
+        old = None
+        if self.incremental:
+            old = self.load_manifest()
+
+        if old is None:
+            unchanged = set()
+        else:
+            unchanged = {
+                path
+                for path, stat in stats.items()
+                if path in old["granules"]
+                and old["granules"][path]["size"] == stat["size"]
+                and old["granules"][path]["mtime"] == stat["mtime"]
+            }
+            existing = load_product(product_path(edir / self.name, self.store))
+            self.logger.info(
+                f"Reading {len(self.files) - len(unchanged)} new or changed files"
+            )
+
+        toread = [file for file in self.files if str(file) not in unchanged]
+        granules = read_granules(toread, self.name, select, self.workers)
+        manifest = {"params": params, "granules": {}}
 
         for file in tqdm(self.files, desc=f"Getting MLS {self.name} data"):
-            with h5py.File(file, "r") as fh:
-                data = fh["HDFEOS"]
-                swaths = data["SWATHS"]
-                prod = swaths[self.name]
-                datafields = prod["Data Fields"]
-                geolocfields = prod["Geolocation Fields"]
-
-                self.get_data(datafields)
-                self.get_geoloc(geolocfields)
-
-                for i, _ in enumerate(self.dt):
-                    # make sure that only real coords is present
-                    if (
-                        #                        self.lat[i] >= 65.5
-                        self.lat[i] <= 90 and self.lat[i] >= -90
-                        #                        and self.lon[i] >= 18.5
-                        #                        and self.lon[i] <= 25
-                    ):
-                        mls = (self.lat[i], self.lon[i])
-                        haversinedist = haversine(
-                            self.loc,
-                            mls,
-                            unit=Unit.KILOMETERS,
-                        )
-                    else:
-                        continue
-
-                    if (
-                        haversinedist <= self.radii
-                        and start <= self.dt[i].date() <= end
-                    ):
-                        umlsdct[self.dt[i]] = {
-                            f"{self.name}": self.prod[i],
-                            "convergence": self.convergence[i],
-                            "l2precision": self.l2_precision[i],
-                            "l2value": self.l2_value[i],
-                            "precision": self.precision[i],
-                            "quality": self.quality[i],
-                            "status": self.status[i],
-                            "lat": self.lat[i],
-                            "lon": self.lon[i],
-                            "pressure": self.p_grid,
-                            "time": self.time[i],
-                        }
-                        files.append(file)
+            path = str(file)
+            if path in unchanged:
+                dts = old["granules"][path]["profiles"]
+                profiles = [(dt, existing[dt]) for dt in dts]
+            else:
+                profiles = next(granules)
+
+            for dt, profile in profiles:
+                umlsdct[dt] = profile
+                files.append(file)
+
+            manifest["granules"][path] = {
+                **stats[path],
+                "profiles": [dt for dt, _ in profiles],
+            }
+        granules.close()
 
         sorted_keys = sorted(umlsdct.keys())
         mlsdct = {key: umlsdct[key] for key in sorted_keys}
@@ -141,56 +574,36 @@ class MLSFindAndMake:
             "sources": files,
         }
 
-        savepath = edir / f"{self.name}.npy"
-        metapath = edir / f"{self.name}.meta.npy"
-
-        np.save(savepath.resolve(), sdict, allow_pickle=True)
+        savepath = save_product(edir.resolve() / self.name, sdict, self.store)
         np.save(metapath.resolve(), mdict, allow_pickle=True)
+        np.save(manifestpath.resolve(), manifest, allow_pickle=True)
         self.logger.info(f"Saved data into {savepath}")
 
-    def get_data(self, datafields):
-        """Method to get all data from data fields
-
-        This is a helper method used to extract all the necessary
-        data from 'Data Fields' in the MLS file
-
-        Args:
-            datafields: dataset with data fields
-        """
-        self.prod = datafields[self.name][()]
-        self.convergence = datafields["Convergence"][()]
-        self.l2_precision = datafields["L2gpPrecision"][()]
-        self.l2_value = datafields["L2gpValue"][()]
-        self.precision = datafields[f"{self.name}Precision"][()]
-        self.quality = datafields["Quality"][()]
-        self.status = datafields["Status"][()]
-
-    def get_geoloc(self, geolocfields):
-        """Method to get all data from geo-location fields
-
-        Helper method to extract the necessary data from the
-        'Geolocation Fields' in the MLS file
-
-        Args:
-            geolocfields: dataset with geolocation fields
-        """
-        self.lat = geolocfields["Latitude"][()]
-        self.lon = geolocfields["Longitude"][()]
-        self.p_grid = geolocfields["Pressure"][()]
-        self.time = geolocfields["Time"][()]
-        self.dt = make_datetime(self.time)
-
 
 class MLSFindAndMakeTracer:
-    def __init__(self, root, logger, latbound=(90, 50), lonbound=(-180, 180)):
+    def __init__(
+        self,
+        root,
+        logger,
+        latbound=(90, 50),
+        lonbound=(-180, 180),
+        workers=1,
+        store="npy",
+        joint=False,
+    ):
         self.root = Path(root).resolve()
         self.tracers = ["O3", "N2O", "ClO", "T"]
         self.latmax = latbound[0]
         self.latmin = latbound[1]
         self.lonmax = lonbound[1]
         self.lonmin = lonbound[0]
+        self.workers = workers
+        self.store = store
         self.logger = logger
-        self.make_mls()
+        if joint:
+            self.make_joint()
+        else:
+            self.make_mls()
 
     def find_mls(self, tracer):
         """Method to find the files
@@ -206,9 +619,8 @@ class MLSFindAndMakeTracer:
         """Method to make the .npy file
 
         This method extracts all necessary datasets to do a proper
-        analysis using MLS data. It also employs the haversine function
-        to limit the data so only data within a certain radii from Kiruna
-        will be extracted
+        analysis using MLS data. Only profiles within the latitude and
+        longitude bounds will be extracted
         """
         for tracer in self.tracers:
             self.find_mls(tracer=tracer)
@@ -221,45 +633,23 @@ class MLSFindAndMakeTracer:
             edir = get_downloadsdir()
             ddir = get_datadir()
             daterange = np.load(ddir / "daterange.npy", allow_pickle=True)
-            start = daterange[0]
-            end = daterange[-1]
-
-            for file in tqdm(self.files, desc=f"Getting MLS {self.name} data"):
-                with h5py.File(file, "r") as fh:
-                    data = fh["HDFEOS"]
-                    swaths = data["SWATHS"]
-                    prod = swaths[self.name]
-                    datafields = prod["Data Fields"]
-                    geolocfields = prod["Geolocation Fields"]
-
-                    self.get_data(datafields)
-                    self.get_geoloc(geolocfields)
-
-                    for i, _ in enumerate(self.dt):
-                        # make sure that only real coords is present
-                        if (
-                            self.lat[i] >= self.latmin
-                            and self.lat[i] <= self.latmax
-                            and self.lon[i] >= self.lonmin
-                            and self.lon[i] <= self.lonmax
-                            and start <= self.dt[i].date() <= end
-                        ):
-                            umlsdct[self.dt[i]] = {
-                                f"{self.name}": self.prod[i],
-                                "convergence": self.convergence[i],
-                                "l2precision": self.l2_precision[i],
-                                "l2value": self.l2_value[i],
-                                "precision": self.precision[i],
-                                "quality": self.quality[i],
-                                "status": self.status[i],
-                                "lat": self.lat[i],
-                                "lon": self.lon[i],
-                                "pressure": self.p_grid,
-                                "time": self.time[i],
-                            }
-                            files.append(file)
-                        else:
-                            continue
+            select = partial(
+                select_box,
+                latbound=(self.latmax, self.latmin),
+                lonbound=(self.lonmin, self.lonmax),
+                start=daterange[0],
+                end=daterange[-1],
+            )
+            granules = read_granules(self.files, self.name, select, self.workers)
+
+            for file, profiles in tqdm(
+                zip(self.files, granules),
+                total=len(self.files),
+                desc=f"Getting MLS {self.name} data",
+            ):
+                for dt, profile in profiles:
+                    umlsdct[dt] = profile
+                    files.append(file)
 
             sorted_keys = sorted(umlsdct.keys())
             mlsdct = {key: umlsdct[key] for key in sorted_keys}
@@ -278,36 +668,99 @@ class MLSFindAndMakeTracer:
             screener = MLSScreener(
                 data=sdict, meta=mdict, screen=screen, logger=self.logger, winter=True
             )
-            screener.save_screened_data(filename=savepath)
-
-    def get_data(self, datafields):
-        """Method to get all data from data fields
-
-        This is a helper method used to extract all the necessary
-        data from 'Data Fields' in the MLS file
-
-        Args:
-            datafields: dataset with data fields
+            screener.save_screened_data(filename=savepath, store=self.store)
+
+    def make_joint(self):
+        """Method to make one file with all tracers
+
+        All tracers are extracted in a single pass, where the profiles
+        are selected once per day from the shared geolocation, see
+        read_joint_granules. The tracers are saved as aligned columns
+        with a shared time index in 'MLS_tracers_joint.h5'. For every
+        tracer '<name>' holds the l2value with negative precisions set
+        to NaN, and '<name>_screened' the profiles passing the screening
+        in '<name>.yaml'
         """
-        self.prod = datafields[self.name][()]
-        self.convergence = datafields["Convergence"][()]
-        self.l2_precision = datafields["L2gpPrecision"][()]
-        self.l2_value = datafields["L2gpValue"][()]
-        self.precision = datafields[f"{self.name}Precision"][()]
-        self.quality = datafields["Quality"][()]
-        self.status = datafields["Status"][()]
+        names = [tracer if tracer != "T" else "Temperature" for tracer in self.tracers]
+        products = dict(zip(self.tracers, names))
 
-    def get_geoloc(self, geolocfields):
-        """Method to get all data from geo-location fields
+        # one walk for all tracers, the tracer is the first directory
+        # below the root as in find_mls
+        self.logger.info(f"Finding MLS files from {self.root}")
+        days = {}
+        for file in sorted(self.root.rglob(pattern="*.he5")):
+            tracer = file.relative_to(self.root).parts[0]
+            if tracer in products:
+                days.setdefault(granule_day(file), {})[products[tracer]] = file
+        days = [
+            {name: days[day][name] for name in names if name in days[day]}
+            for day in sorted(days)
+        ]
+
+        daterange = np.load(get_datadir() / "daterange.npy", allow_pickle=True)
+        select = partial(
+            select_box,
+            latbound=(self.latmax, self.latmin),
+            lonbound=(self.lonmin, self.lonmax),
+            start=daterange[0],
+            end=daterange[-1],
+        )
+        read = partial(read_joint_granules, select=select)
+        parts = list(
+            tqdm(
+                map_ordered(read, days, self.workers),
+                total=len(days),
+                desc="Getting MLS tracers",
+            )
+        )
 
-        Helper method to extract the necessary data from the
-        'Geolocation Fields' in the MLS file
+        # keep the last of duplicated profiles, as the dict products do
+        dt = np.concatenate([part["dt"] for part in parts])
+        _, last = np.unique(dt[::-1], return_index=True)
+        keep = len(dt) - 1 - last
 
-        Args:
-            geolocfields: dataset with geolocation fields
-        """
-        self.lat = geolocfields["Latitude"][()]
-        self.lon = geolocfields["Longitude"][()]
-        self.p_grid = geolocfields["Pressure"][()]
-        self.time = geolocfields["Time"][()]
-        self.dt = make_datetime(self.time)
+        columns = {
+            key: np.concatenate([part[key] for part in parts])[keep]
+            for key in ("lat", "lon", "time")
+        }
+        for name in names:
+            given = [part[name] for part in parts if name in part]
+            if len(given) == 0:
+                continue
+            pressure = given[0]["pressure"]
+
+            fields = {}
+            for key in ("l2_value", "precision", "status", "quality", "convergence"):
+                levels = (len(pressure),) if key in ("l2_value", "precision") else ()
+                fields[key] = np.concatenate(
+                    [
+                        part[name][key]
+                        if name in part
+                        else np.full((len(part["dt"]), *levels), np.nan)
+                        for part in parts
+                    ]
+                )[keep]
+
+            screenfile = get_datadir() / f"{name}.yaml"
+            with open(screenfile, "r") as fh:
+                screen = yaml.load(fh, Loader=yaml.SafeLoader)
+
+            fields["time"] = dt[keep]
+            screened = apply_rules(compile_screen(screen, winter=True), fields)
+
+            columns[name] = np.where(screened.levels, fields["l2_value"], np.nan)
+            columns[f"{name}_precision"] = fields["precision"]
+            columns[f"{name}_pressure"] = np.tile(pressure, (len(keep), 1))
+            columns[f"{name}_status"] = fields["status"]
+            columns[f"{name}_quality"] = fields["quality"]
+            columns[f"{name}_convergence"] = fields["convergence"]
+            columns[f"{name}_screened"] = screened.mask
+
+        product = ColumnarProduct(
+            time=dt[keep].astype("datetime64[us]"),
+            columns=columns,
+            kinds={key: "numeric" for key in columns},
+        )
+        savepath = get_downloadsdir() / JOINT_TRACERS
+        save_columnar(savepath, product)
+        self.logger.info(f"Saved joint tracer data into {savepath}")
@@ -33,6 +33,24 @@ def m2make_parser(subparser):
     )
 
     subparser.add_argument("--dataset", type=str, help="Which retrieval configuration")
+    subparser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes used to read the MIRA2 files",
+    )
+    subparser.add_argument(
+        "--split-spectra",
+        action="store_true",
+        help="Keep the spectra in a separate file, read on demand",
+    )
+    subparser.add_argument(
+        "--store",
+        type=str,
+        default="npy",
+        choices=["npy", "h5"],
+        help="Store products as pickled .npy dictionaries or columnar .h5 files",
+    )
 
 
 def mlsmake_parser(subparser):
@@ -48,6 +66,24 @@ def mlsmake_parser(subparser):
         default=200,
         help="Whether to create a file for the product",
     )
+    subparser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes used to read the MLS files",
+    )
+    subparser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only read new or changed MLS files and merge them into the product",
+    )
+    subparser.add_argument(
+        "--store",
+        type=str,
+        default="npy",
+        choices=["npy", "h5"],
+        help="Store products as pickled .npy dictionaries or columnar .h5 files",
+    )
 
 
 def screening_parser(subparser):
@@ -72,6 +108,42 @@ def screening_parser(subparser):
         default=200,
         help="Whether to create a file for the product",
     )
+    subparser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes used to read the MLS files",
+    )
+    subparser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only read new or changed MLS files and merge them into the product",
+    )
+    subparser.add_argument(
+        "--store",
+        type=str,
+        default="npy",
+        choices=["npy", "h5"],
+        help="Store products as pickled .npy dictionaries or columnar .h5 files",
+    )
+    subparser.add_argument(
+        "--force",
+        action="store_true",
+        help="Make the product again even if it is up to date with the files",
+    )
+    subparser.add_argument(
+        "--sweep",
+        type=str,
+        action="append",
+        default=None,
+        help="Screen with every value of a parameter, as name=value1,value2,... "
+        "Repeat for a grid of several parameters",
+    )
+    subparser.add_argument(
+        "--pressure-range",
+        action="store_true",
+        help="Mask MLS levels outside the pmin to pmax range of the screen file",
+    )
 
 
 def match_parser(subparser):
@@ -81,6 +153,23 @@ def match_parser(subparser):
     subparser.add_argument(
         "--mls", type=str, default=None, help="Path to the screened MLS file"
     )
+    subparser.add_argument(
+        "--hours",
+        type=float,
+        default=None,
+        help="Match MLS profiles within this many hours of a retrieval, with --km",
+    )
+    subparser.add_argument(
+        "--km",
+        type=float,
+        default=None,
+        help="Match MLS profiles within this many kilometers of MIRA2, with --hours",
+    )
+    subparser.add_argument(
+        "--all",
+        action="store_true",
+        help="Keep all coincident MLS profiles, not only the nearest in time",
+    )
 
 
 def plotting_parser(subparser):
@@ -97,3 +186,97 @@ def tracers_parser(subparser):
         default=None,
         help="MLS directory where product data is located",
     )
+    subparser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes used to read the MLS files",
+    )
+    subparser.add_argument(
+        "--store",
+        type=str,
+        default="npy",
+        choices=["npy", "h5"],
+        help="Store products as pickled .npy dictionaries or columnar .h5 files",
+    )
+    subparser.add_argument(
+        "--joint",
+        action="store_true",
+        help="Extract all tracers in one pass into a single aligned file",
+    )
+
+
+def loss_parser(subparser):
+    subparser.add_argument(
+        "--fit", type=str, default=None, help="Path to the N2O-O3 fit .npz file"
+    )
+    subparser.add_argument(
+        "--isopleths",
+        type=float,
+        nargs="+",
+        default=None,
+        help="N2O isopleths in ppbv, or isentropes in K with --coordinate theta",
+    )
+    subparser.add_argument(
+        "--coordinate",
+        type=str,
+        default="n2o",
+        choices=["n2o", "theta"],
+        help="Find the levels by N2O or by potential temperature",
+    )
+    subparser.add_argument(
+        "--n2o",
+        type=str,
+        default=None,
+        help="Path to the matched MLS N2O tracer file, from the downloads by default",
+    )
+    subparser.add_argument(
+        "--o3",
+        type=str,
+        default=None,
+        help="Path to the matched MLS O3 tracer file, from the downloads by default",
+    )
+    subparser.add_argument(
+        "--joint",
+        type=str,
+        nargs="?",
+        const=True,
+        default=None,
+        help="Use the joint tracer file of tracersmake --joint, from the downloads "
+        "unless a path is given, instead of the matched tracer files",
+    )
+    subparser.add_argument(
+        "--vortex",
+        type=str,
+        default=None,
+        help="Path to the vortex file with theta and edge masks, dmpdata.npy",
+    )
+    subparser.add_argument(
+        "--mira2", type=str, default=None, help="Path to the matched MIRA2 file"
+    )
+    subparser.add_argument(
+        "--period",
+        type=str,
+        default=None,
+        choices=["day", "night"],
+        help="Only use the profiles measured around midday or midnight",
+    )
+    subparser.add_argument(
+        "--ensemble",
+        action="store_true",
+        help="Use the resampled ensemble of the fit for the passive ozone error",
+    )
+    subparser.add_argument(
+        "--pairing",
+        type=str,
+        default="all",
+        choices=["all", "nearest"],
+        help="Pair MIRA2 with all MLS profiles on its date, or the nearest in time",
+    )
+    subparser.add_argument(
+        "--error",
+        type=str,
+        default="linear",
+        choices=["linear", "quadrature"],
+        help="Add the MIRA2 and passive ozone errors linearly or in quadrature",
+    )
@@ -0,0 +1,261 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable
+from numpy.typing import NDArray
+import numpy as np
+
+
+@dataclass
+class Rule:
+    """Screening rule compiled from a .yaml screen file
+
+    Attributes:
+        name: name of the rule, used for the rejection counts
+        test: function taking the columns and returning a boolean
+            mask with the profiles, or levels, passing the rule
+        level: if the rule masks single levels of the profiles
+            instead of whole profiles
+    """
+
+    name: str
+    test: Callable[[dict], NDArray]
+    level: bool = False
+
+
+@dataclass
+class Screened:
+    """Result of applying screening rules
+
+    Attributes:
+        mask: boolean mask with the profiles passing all profile rules
+        levels: boolean (n_profiles, n_levels) mask with the levels
+            passing all level rules, None without level rules
+        rejected: the rule name mapped to the number of profiles, or
+            levels for level rules, failing the rule. Every rule is
+            counted on its own, so a profile can be counted by several
+    """
+
+    mask: NDArray
+    levels: NDArray | None
+    rejected: dict = field(default_factory=dict)
+
+
+def extrema(column: NDArray) -> tuple:
+    """Function to get the max and min of every profile
+
+    Args:
+        column: column with one array per profile, stacked or
+            as an object array if the shapes differ
+
+    Returns:
+        the max and min of every profile
+    """
+    if column.dtype == object:
+        mx = np.array([np.max(v) for v in column], dtype=float)
+        mn = np.array([np.min(v) for v in column], dtype=float)
+        return mx, mn
+
+    axes = tuple(range(1, column.ndim))
+    return column.max(axis=axes), column.min(axis=axes)
+
+
+def time_of_day(dt: NDArray) -> NDArray:
+    """Function to get the time of day
+
+    Args:
+        dt: datetimes of the profiles
+
+    Returns:
+        timedelta64[us] since midnight
+    """
+    dt = np.asarray(dt, dtype="datetime64[us]")
+    return dt - dt.astype("datetime64[D]")
+
+
+def hours(h: float) -> np.timedelta64:
+    return np.timedelta64(int(round(h * 3600e6)), "us")
+
+
+def status_rule(criterion: str) -> Rule:
+    match criterion:
+        case "not_odd":
+            return Rule("status", lambda c: c["status"] % 2 == 0)
+        case "equal_zero":
+            return Rule("status", lambda c: c["status"] == 0)
+        case _:
+            raise ValueError(f"Unknown status criterion {criterion}")
+
+
+def winter_rule() -> Rule:
+    start = np.datetime64(datetime(2019, 10, 1, 0, 0, 0), "us")
+    end = np.datetime64(datetime(2020, 5, 1, 0, 0, 0), "us")
+
+    def test(c):
+        dt = np.asarray(c["time"], dtype="datetime64[us]")
+        return (dt >= start) & (dt <= end)
+
+    return Rule("winter", test)
+
+
+def daynight_rule(dday: int, dnight: int) -> Rule:
+    # the windows are whole hours, as datetime.time requires
+    day = (hours(12 - dday), hours(12 + dday))
+    night = (hours(2 - dnight), hours(2 + dnight))
+
+    def test(c):
+        t = time_of_day(c["time"])
+        return ((t >= day[0]) & (t <= day[1])) | ((t >= night[0]) & (t <= night[1]))
+
+    return Rule("daynight", test)
+
+
+def residual_rule(delta: float) -> Rule:
+    def test(c):
+        if "residual_max" in c:
+            mx, mn = c["residual_max"], c["residual_min"]
+        else:
+            mx, mn = extrema(c["residual"])
+        return (mx <= delta) & (mn >= -delta)
+
+    return Rule("residual", test)
+
+
+def mr_rule(mr_min: float) -> Rule:
+    def test(c):
+        mx, mn = extrema(c["mr"])
+        return (mx >= mr_min) & (mn >= 0)
+
+    return Rule("mr", test)
+
+
+def pressure_rule(pmax: float, pmin: float) -> Rule:
+    def test(c):
+        pressure = c["pressure"]
+        return (pressure <= pmax) & (pressure >= pmin)
+
+    return Rule("pressure", test, level=True)
+
+
+def compile_screen(
+    screen: dict, winter: bool = False, pressure_range: bool = False
+) -> list:
+    """Function to compile a screen file into rules
+
+    MLS screens have status, quality, convergence and precision
+    criteria, where the precision masks single levels and defaults
+    to 0. MIRA2 screens keep the measurements around midday and
+    midnight, and have convergence, residual and measurement
+    response criteria
+
+    Args:
+        screen: screening criteria from the product's .yaml file
+        winter: if only the 2019/2020 winter should be kept
+        pressure_range: if MLS levels outside the recommended
+            pressure range, 'pmin' to 'pmax' hPa, should be masked
+
+    Returns:
+        the rules of the screen
+    """
+    rules = []
+    if screen["dataset"] == "mira2":
+        rules.append(daynight_rule(screen["midday-delta"], screen["midnight-delta"]))
+        convergence = screen["convergence"]
+        rules.append(Rule("convergence", lambda c: c["convergence"] == convergence))
+        rules.append(residual_rule(screen["res-delta"]))
+        rules.append(mr_rule(screen["mr-min"]))
+    else:
+        rules.append(status_rule(screen["status"]))
+        quality = screen["quality"]
+        rules.append(Rule("quality", lambda c: c["quality"] > quality))
+        convergence = screen["convergence"]
+        rules.append(Rule("convergence", lambda c: c["convergence"] < convergence))
+        # levels with a negative precision are not to be used
+        precision = screen.get("precision", 0)
+        rules.append(
+            Rule("precision", lambda c: ~(c["precision"] < precision), level=True)
+        )
+        if pressure_range:
+            rules.append(pressure_rule(screen["pmax"], screen["pmin"]))
+
+    if winter:
+        rules.append(winter_rule())
+    return rules
+
+
+def apply_rules(rules: list, columns: dict) -> Screened:
+    """Function to apply screening rules to columns
+
+    Args:
+        rules: the rules, see compile_screen
+        columns: the field name mapped to its column, with the
+            profiles along the first axis and 'time' holding the
+            datetimes of the profiles
+
+    Returns:
+        the profiles and levels passing the rules
+    """
+    n = len(columns["time"])
+    mask = np.ones(n, dtype=bool)
+    levels = None
+    rejected = {}
+
+    for rule in rules:
+        passed = np.asarray(rule.test(columns), dtype=bool)
+        rejected[rule.name] = int(passed.size - np.count_nonzero(passed))
+        if rule.level:
+            levels = passed if levels is None else levels & passed
+        else:
+            mask &= passed
+
+    return Screened(mask=mask, levels=levels, rejected=rejected)
+
+
+def mask_levels(values: NDArray, levels: NDArray | None) -> NDArray:
+    """Function to set the levels failing the level rules to NaN
+
+    Args:
+        values: (n_profiles, n_levels) values of the profiles
+        levels: the levels passing the level rules, see Screened
+
+    Returns:
+        float64 copy of the values with the failing levels as NaN
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if levels is None:
+        return values.copy()
+    return np.where(levels, values, np.nan)
+
+
+def stack_columns(data: dict, names: list) -> dict:
+    """Function to stack fields of a dict product into columns
+
+    Fields that are in none of the profiles are left out, fields that
+    are only in some of them raise a ValueError
+
+    Args:
+        data: dictionary with the profiles keyed by datetime
+        names: the fields to stack
+
+    Returns:
+        the field name mapped to its column, and 'time' with the
+        datetimes of the profiles
+    """
+    records = list(data.values())
+    columns = {"time": np.array(list(data.keys()), dtype="datetime64[us]")}
+    for name in names:
+        given = sum(name in record for record in records)
+        if len(records) == 0:
+            columns[name] = np.array([])
+        elif 0 < given < len(records):
+            raise ValueError(
+                f"Field {name} is in {given} of {len(records)} profiles, "
+                "it must be in all or none of them"
+            )
+        elif given:
+            values = [record[name] for record in records]
+            try:
+                columns[name] = np.array(values)
+            except ValueError:
+                columns[name] = np.empty(len(values), dtype=object)
+                columns[name][:] = values
+    return columns
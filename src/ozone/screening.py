@@ -1,23 +1,116 @@
 from .io import get_datadir, get_exportdir, get_downloadsdir
+from .store import STORES, product_path, save_product, load_product
+from .rules import compile_screen, apply_rules, stack_columns, mask_levels
+from .utils import map_ordered
+from functools import partial
+import itertools
+from pathlib import Path
 import numpy as np
 import yaml
-from datetime import datetime, time
-
-
-def screen_MLS_precision(data, dataset):
-    for vals in data.values():
-        precision = vals["precision"]
-        product = vals["l2value"]
-        newprod = []
-        for prec, prod in zip(precision, product):
-            if prec < 0:
-                newprod.append(np.nan)
-            else:
-                newprod.append(prod)
-
-        vals[dataset] = np.array(newprod)
-
-    return data
+import csv
+
+
+def sweep_grid(sweeps: list) -> list:
+    """Function to make the grid of a screening sweep
+
+    Args:
+        sweeps: strings 'name=value1,value2,...' with a screening
+            parameter of the .yaml file and the values to try
+
+    Returns:
+        dictionaries with the parameters of every combination
+    """
+    names, values = [], []
+    for sweep in sweeps:
+        name, _, given = sweep.partition("=")
+        names.append(name.strip())
+        values.append([yaml.safe_load(v) for v in given.split(",")])
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def _sweep_screen(grid, screen, columns, value, winter, pressure_range):
+    rows = []
+    for params in grid:
+        rules = compile_screen({**screen, **params}, winter, pressure_range)
+        screened = apply_rules(rules, columns)
+        row = {**params, "profiles": len(screened.mask)}
+        row["passed"] = int(np.count_nonzero(screened.mask))
+        row.update({f"rejected_{k}": v for k, v in screened.rejected.items()})
+
+        levels = screened.levels
+        values = mask_levels(
+            columns[value][screened.mask],
+            None if levels is None else levels[screened.mask],
+        )
+        values = values[np.isfinite(values)]
+        row["mean"] = values.mean() if values.size else np.nan
+        row["std"] = values.std() if values.size else np.nan
+        rows.append(row)
+    return rows
+
+
+def sweep_screen(
+    screen: dict,
+    columns: dict,
+    value: str,
+    grid: list,
+    winter: bool = False,
+    pressure_range: bool = False,
+    workers: int = 1,
+) -> list:
+    """Function to screen a product with a grid of parameters
+
+    The grid is split into one part per worker, so the columns
+    are only sent once to every worker process
+
+    Args:
+        screen: screening criteria from the product's .yaml file
+        columns: the columns of the product, see stack_columns
+        value: name of the column with the values of the product
+        grid: dictionaries with the parameters to change in the screen
+        winter: if only the 2019/2020 winter should be kept
+        pressure_range: if levels outside the recommended pressure
+            range should be masked, see compile_screen
+        workers: number of worker processes
+
+    Returns:
+        a row for every parameter combination with the parameters,
+        the number of profiles passing and rejected by every rule,
+        and the mean and standard deviation of the screened values
+    """
+    for name in {name for params in grid for name in params}:
+        if name not in screen:
+            raise ValueError(f"Unknown screening parameter {name}")
+
+    parts = [part.tolist() for part in np.array_split(np.arange(len(grid)), workers)]
+    parts = [[grid[i] for i in part] for part in parts if len(part)]
+    func = partial(
+        _sweep_screen,
+        screen=screen,
+        columns=columns,
+        value=value,
+        winter=winter,
+        pressure_range=pressure_range,
+    )
+    return [row for rows in map_ordered(func, parts, workers) for row in rows]
+
+
+def save_sweep(rows: list, filename: str) -> Path:
+    """Function to save the table of a screening sweep
+
+    Args:
+        rows: the rows from sweep_screen
+        filename: name of the table, without suffix
+
+    Returns:
+        path of the .csv file
+    """
+    savepath = get_downloadsdir() / f"{filename}.csv"
+    with open(savepath, "w", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return savepath
 
 
 class DataScreener:
@@ -32,18 +125,16 @@ class DataScreener:
         self.read_data()
 
     def find_dataset(self):
-        files = [file for file in self.edir.rglob(pattern=f"{self.dataset}*")]
-        files = np.array(files)
+        self.metadata_fp = self.edir / f"{self.dataset}.meta.npy"
+        files = [product_path(self.edir / self.dataset, store) for store in STORES]
+        files = [file for file in files if file.exists()]
 
-        assert len(files) > 0, (
+        assert self.metadata_fp.exists() and len(files) > 0, (
             "Check dataset name and that it exitstsin $HOME/.cache/m2exports"
         )
 
-        for file in files:
-            if "meta" in file.name:
-                self.metadata_fp = file
-            else:
-                self.dataset_fp = file
+        # use the most recently made product if there are several stores
+        self.dataset_fp = max(files, key=lambda file: file.stat().st_mtime)
 
     def find_screen_file(self):
         if "mira2".upper() not in self.dataset:
@@ -53,7 +144,7 @@ class DataScreener:
 
     def read_data(self):
         self.meta = np.load(self.metadata_fp, allow_pickle=True).item()
-        self.data = np.load(self.dataset_fp, allow_pickle=True).item()
+        self.data = load_product(self.dataset_fp)
 
         with open(self.screen_fp, "r") as fh:
             self.screen = yaml.load(fh, Loader=yaml.SafeLoader)
@@ -63,69 +154,53 @@ class DataScreener:
 
 
 class MLSScreener:
-    def __init__(self, data, meta, screen, logger, winter):
+    def __init__(self, data, meta, screen, logger, winter, pressure_range=False):
         self.meta = meta
         self.data = data
         self.screen = screen
         self.logger = logger
         self.winter = winter
+        self.pressure_range = pressure_range
         self.get_data()
 
     def get_data(self):
         self.dt = np.array([dt for dt in self.data.keys()])
-        self.precision = np.array([data["precision"] for data in self.data.values()])
-        self.status = np.array([data["status"] for data in self.data.values()])
-        self.quality = np.array([data["quality"] for data in self.data.values()])
-        self.convergence = np.array(
-            [data["convergence"] for data in self.data.values()]
+        self.columns = stack_columns(
+            self.data,
+            ["status", "quality", "convergence", "precision", "pressure", "l2value"],
         )
-        self.pressure = np.array([data["pressure"] for data in self.data.values()])
 
-    def _screen_status(self):
-        status = self.screen["status"]
-        if status == "not_odd":
-            self.status_mask = self.status % 2 == 0
-
-        if status == "equal_zero":
-            self.status_mask = self.status == 0
-
-    def _screen_quality(self):
-        quality = self.screen["quality"]
-        self.quality_mask = self.quality > quality
+    def save_screened_data(self, filename, store="npy"):
+        rules = compile_screen(self.screen, self.winter, self.pressure_range)
+        screened = apply_rules(rules, self.columns)
+        product = self.meta["product"]
+        self.logger.info(f"Rejected by each {product} rule: {screened.rejected}")
 
-    def _screen_convergence(self):
-        convergence = self.screen["convergence"]
-        self.convergence_mask = self.convergence < convergence
+        index = np.flatnonzero(screened.mask)
+        values = mask_levels(self.columns["l2value"][index], screened.levels[index])
+        mdict = {}
+        for i, value in zip(index, values):
+            vals = self.data[self.dt[i]]
+            vals[product] = value
+            mdict[self.dt[i]] = vals
 
-    def _screen_winter(self):
-        start = datetime(2019, 10, 1, 0, 0, 0)
-        end = datetime(2020, 5, 1, 0, 0, 0)
-        dts = np.array([dt for dt in self.data.keys()])
-        self.winter_mask = (dts >= start) & (dts <= end)
+        savepath = save_product(get_downloadsdir() / f"{filename}", mdict, store)
+        self.logger.info(f"Screened {product} file saved in {savepath}")
 
-    def save_screened_data(self, filename):
-        if self.winter:
-            self._screen_winter()
-        else:
-            self.winter_mask = np.array([True for dt in self.data.keys()])
-        self._screen_status()
-        self._screen_quality()
-        self._screen_convergence()
-        #        self._screen_precision()
-
-        combined_mask = (
-            self.status_mask
-            & self.quality_mask
-            & self.convergence_mask
-            & self.winter_mask
+    def save_sweep(self, filename, sweeps, workers=1):
+        grid = sweep_grid(sweeps)
+        rows = sweep_screen(
+            self.screen,
+            self.columns,
+            "l2value",
+            grid,
+            self.winter,
+            self.pressure_range,
+            workers,
         )
-        screened_dts = self.dt[combined_mask]
-        mdict = {dt: self.data[dt] for dt in screened_dts}
+        savepath = save_sweep(rows, f"{filename}_sweep")
         product = self.meta["product"]
-        data = screen_MLS_precision(mdict, product)
-        savepath = get_downloadsdir() / f"{filename}.npy"
-        np.save(savepath, data, allow_pickle=True)
-        self.logger.info(f"Screened {product} file saved in {savepath}")
+        self.logger.info(f"Screening sweep of {product} saved in {savepath}")
 
 
 class MIRA2Screener:
@@ -137,59 +212,28 @@ class MIRA2Screener:
         self.get_data()
 
     def get_data(self):
-        msk = self.get_day_and_night_data()
-        tmp = {k: v for (k, v), b in zip(self.data.items(), msk) if b}
-
-        self.data = tmp
-        self.dt = np.array([k for k in self.data.keys()])
-        self.convergence = np.array([val["convergence"] for val in self.data.values()])
-        self.mr = np.array([val["mr"] for val in self.data.values()])
-        self.residual = np.array([val["residual"] for val in self.data.values()])
-        self.meastime = np.array([val["meastime"] for val in self.data.values()])
-
-    def get_day_and_night_data(self):
-        dday = self.screen["midday-delta"]
-        dnight = self.screen["midnight-delta"]
-
-        tarr = np.array([t.time() for t in self.data.keys()])
-        msk = np.zeros_like(tarr)
-        day = [time(12 - dday, 0, 0), time(12 + dday, 0, 0)]
-        night = [time(2 - dnight, 0, 0), time(2 + dnight, 0, 0)]
-
-        for i, t in enumerate(tarr):
-            dbool = day[0] <= t <= day[-1]
-            nbool = night[0] <= t <= night[-1]
-            if dbool or nbool:
-                msk[i] = True
-            else:
-                msk[i] = False
-        return msk
-
-    def _screen_convergence(self):
-        self.convergence_mask = self.convergence == self.screen["convergence"]
-
-    def _screen_residual(self):
-        dres = self.screen["res-delta"]
-        mx = np.array([r.max() for r in self.residual])
-        mn = np.array([r.min() for r in self.residual])
-        self.residual_mask = (mx <= dres) & (mn >= -dres)
-
-    def _screen_mr(self):
-        mx = np.array([mr.max() for mr in self.mr])
-        mn = np.array([mr.min() for mr in self.mr])
-        mr_min = self.screen["mr-min"]
-        self.mr_mask = (mx >= mr_min) & (mn >= 0)
-
-    def save_screened_data(self, filename):
-        self._screen_convergence()
-        self._screen_residual()
-        self._screen_mr()
-
-        combined_mask = self.convergence_mask & self.residual_mask & self.mr_mask
-
-        screened_dts = self.dt[combined_mask]
-        mdict = {dt: self.data[dt] for dt in screened_dts}
-        savepath = get_downloadsdir() / f"{filename}.npy"
+        self.dt = np.array([dt for dt in self.data.keys()])
+        # products made with split spectra carry the residual extrema
+        self.columns = stack_columns(
+            self.data,
+            ["convergence", "mr", "residual", "residual_max", "residual_min", "x_phys"],
+        )
+
+    def save_screened_data(self, filename, store="npy"):
+        rules = compile_screen(self.screen)
+        screened = apply_rules(rules, self.columns)
         product = self.meta["product"]
-        np.save(savepath, mdict, allow_pickle=True)
+        self.logger.info(f"Rejected by each {product} rule: {screened.rejected}")
+
+        mdict = {dt: self.data[dt] for dt in self.dt[screened.mask]}
+        savepath = save_product(get_downloadsdir() / f"{filename}", mdict, store)
         self.logger.info(f"Screened {product} file saved in {savepath}")
+
+    def save_sweep(self, filename, sweeps, workers=1):
+        grid = sweep_grid(sweeps)
+        rows = sweep_screen(
+            self.screen, self.columns, "x_phys", grid, workers=workers
+        )
+        savepath = save_sweep(rows, f"{filename}_sweep")
+        product = self.meta["product"]
+        self.logger.info(f"Screening sweep of {product} saved in {savepath}")
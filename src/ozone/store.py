@@ -0,0 +1,505 @@
+from pathlib import Path
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from numpy.typing import NDArray
+import h5py
+import numpy as np
+
+STORES = ("npy", "h5")
+
+
+@dataclass
+class ColumnarProduct:
+    """Product stored as columns
+
+    Every column holds one field for all profiles, with the
+    profiles along the first axis, so a MLS product becomes
+    (n_profiles, n_levels) arrays instead of a dict of dicts.
+
+    Attributes:
+        time: datetime64[us] index with one entry per profile
+        columns: the field name mapped to its column
+        kinds: the field name mapped to how it is encoded, one of
+            'numeric', 'str', 'path' or 'timedelta'
+        present: for fields missing in some profiles, the field name
+            mapped to a boolean mask with the profiles that have it
+        shapes: for fields whose shape differs between profiles, the
+            field name mapped to a (n_profiles, ndim) array with the
+            shape of every profile. The column is padded to the
+            largest shape
+    """
+
+    time: NDArray
+    columns: dict
+    kinds: dict
+    present: dict = field(default_factory=dict)
+    shapes: dict = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def __getitem__(self, name: str) -> NDArray:
+        return self.columns[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.columns
+
+    def select(self, mask: NDArray) -> "ColumnarProduct":
+        """Method to select a subset of the profiles
+
+        Args:
+            mask: boolean mask or indices of the profiles to keep
+
+        Returns:
+            new product with the selected profiles
+        """
+        return ColumnarProduct(
+            time=self.time[mask],
+            columns={k: v[mask] for k, v in self.columns.items()},
+            kinds=dict(self.kinds),
+            present={k: v[mask] for k, v in self.present.items()},
+            shapes={k: v[mask] for k, v in self.shapes.items()},
+        )
+
+    def record(self, i: int) -> dict:
+        """Method to get the fields of one profile
+
+        Args:
+            i: index of the profile
+
+        Returns:
+            dictionary with the fields of the profile
+        """
+        record = {}
+        for name, column in self.columns.items():
+            if name in self.present and not self.present[name][i]:
+                continue
+
+            value = column[i]
+            if name in self.shapes:
+                value = value[tuple(slice(0, n) for n in self.shapes[name][i])]
+            record[name] = _decode(value, self.kinds[name])
+        return record
+
+    def to_dict(self) -> dict:
+        """Method to get the dict view of the product
+
+        This returns the same dictionary keyed by datetime that the
+        .npy products hold, so older scripts can use the columnar
+        products unchanged. Numeric fields are promoted to a common
+        dtype for all profiles
+
+        Returns:
+            dictionary with the profiles keyed by datetime
+        """
+        keys = self.time.astype(datetime)
+        return {key: self.record(i) for i, key in enumerate(keys)}
+
+
+def _kind(values: list) -> str:
+    """Function to find how a field is encoded
+
+    Args:
+        values: the values of the field for all profiles
+
+    Returns:
+        the kind of the field
+    """
+    for value in values:
+        arr = np.asarray(value)
+        if arr.dtype != object or arr.size == 0:
+            continue
+
+        first = arr.flat[0]
+        if isinstance(first, Path):
+            return "path"
+        if isinstance(first, str):
+            return "str"
+        if isinstance(first, timedelta):
+            return "timedelta"
+        raise TypeError(f"Can not store values of type {type(first)}")
+    return "numeric"
+
+
+def _encode(value, kind: str) -> NDArray:
+    """Function to encode a value of a field as a numpy array
+
+    Finite numbers in a timedelta field are taken as seconds. Other
+    values that do not match the kind of the field, such as the
+    NaN's from utils.fill_nans, become empty strings or NaT
+
+    Args:
+        value: the value to encode
+        kind: the kind of the field
+
+    Returns:
+        the encoded value
+    """
+    arr = np.asarray(value)
+    match kind:
+        case "numeric":
+            return arr
+        case "str" | "path":
+            flat = [str(v) if isinstance(v, (str, Path)) else "" for v in arr.flat]
+            return np.array(flat, dtype=str).reshape(arr.shape)
+        case "timedelta":
+            flat = []
+            for v in arr.flat:
+                if isinstance(v, timedelta):
+                    flat.append(np.timedelta64(v, "us"))
+                elif np.isfinite(v):
+                    flat.append(np.timedelta64(round(v * 1e6), "us"))
+                else:
+                    flat.append(np.timedelta64("NaT", "us"))
+            return np.array(flat, dtype="timedelta64[us]").reshape(arr.shape)
+
+
+def _decode(value, kind: str):
+    """Function to decode a value of a field from its column
+
+    A value that is only empty strings or NaT was filled with NaN's
+    by utils.fill_nans, and is decoded to the float NaN's stored in
+    the dict product
+
+    Args:
+        value: the value from the column
+        kind: the kind of the field
+
+    Returns:
+        the value as it was in the dict product
+    """
+    arr = np.asarray(value)
+    match kind:
+        case "numeric":
+            return value
+        case "str" | "path":
+            arr = arr.astype(str)
+            empty = arr == ""
+        case "timedelta":
+            empty = np.isnat(arr)
+
+    if arr.size > 0 and empty.all():
+        return np.full(arr.shape, np.nan)
+
+    match kind:
+        case "str":
+            return arr
+        case "path":
+            flat = [Path(v) if v else np.nan for v in arr.flat]
+            return np.array(flat, dtype=object).reshape(arr.shape)
+        case "timedelta":
+            decoded = arr.astype(object)
+            decoded[empty] = np.nan
+            return decoded
+
+
+def _fill(dtype: np.dtype):
+    """Function to get the value used for padding a column
+
+    Args:
+        dtype: dtype of the column
+
+    Returns:
+        the padding value
+    """
+    match dtype.kind:
+        case "f" | "c":
+            return np.nan
+        case "m":
+            return np.timedelta64("NaT", "us")
+        case "U":
+            return ""
+        case _:
+            return 0
+
+
+def to_columns(data: dict) -> ColumnarProduct:
+    """Function to convert a dict product to columns
+
+    Args:
+        data: dictionary with the profiles keyed by datetime
+
+    Returns:
+        the columnar product
+    """
+    records = list(data.values())
+    n = len(records)
+    time = np.array(list(data.keys()), dtype="datetime64[us]").reshape(n)
+
+    names = []
+    for record in records:
+        for name in record:
+            if name not in names:
+                names.append(name)
+
+    columns, kinds, present, shapes = {}, {}, {}, {}
+    for name in names:
+        mask = np.array([name in record for record in records], dtype=bool)
+        kind = _kind([record[name] for record in records if name in record])
+        values = [
+            _encode(record[name], kind) if name in record else None
+            for record in records
+        ]
+        given = [value for value in values if value is not None]
+
+        ndim = given[0].ndim
+        if any(value.ndim != ndim for value in given):
+            raise ValueError(f"Dimensions of {name} differ between profiles")
+
+        dtype = np.result_type(*[value.dtype for value in given])
+        vshapes = np.zeros((n, ndim), dtype=np.int64)
+        for i, value in enumerate(values):
+            if value is not None:
+                vshapes[i] = value.shape
+        maxshape = tuple(int(s) for s in vshapes[mask].max(axis=0))
+
+        column = np.full((n, *maxshape), _fill(dtype), dtype=dtype)
+        for i, value in enumerate(values):
+            if value is not None:
+                column[(i, *(slice(0, s) for s in value.shape))] = value
+
+        columns[name] = column
+        kinds[name] = kind
+        if not mask.all():
+            present[name] = mask
+        if (vshapes[mask] != maxshape).any():
+            shapes[name] = vshapes
+
+    return ColumnarProduct(
+        time=time, columns=columns, kinds=kinds, present=present, shapes=shapes
+    )
+
+
+def save_columnar(path: Path, product: ColumnarProduct, chunked: bool = False):
+    """Function to save a columnar product into a HDF5 file
+
+    The columns are written as contiguous datasets so they can
+    be memory-mapped when loaded, or chunked by profile so single
+    profiles can be read on demand, see LazyProduct
+
+    Args:
+        path: path of the .h5 file
+        product: the columnar product
+        chunked: if the columns should be chunked by profile
+    """
+    with h5py.File(path, "w") as fh:
+        fh.create_dataset("time", data=product.time.view(np.int64))
+        group = fh.create_group("columns", track_order=True)
+        for name, column in product.columns.items():
+            if column.dtype.kind == "U":
+                column = np.char.encode(column, "utf-8")
+            elif column.dtype.kind == "m":
+                column = column.view(np.int64)
+            chunks = (1, *column.shape[1:]) if chunked and column.ndim > 1 else None
+            dset = group.create_dataset(name, data=column, chunks=chunks)
+            dset.attrs["kind"] = product.kinds[name]
+
+        for name, mask in product.present.items():
+            fh.create_dataset(f"present/{name}", data=mask)
+        for name, shape in product.shapes.items():
+            fh.create_dataset(f"shapes/{name}", data=shape)
+
+
+def _read(path: Path, dset: h5py.Dataset, mmap: bool) -> NDArray:
+    """Function to read a dataset, memory-mapped if possible
+
+    Args:
+        path: path of the .h5 file
+        dset: the dataset
+        mmap: if the dataset should be memory-mapped
+
+    Returns:
+        the data of the dataset
+    """
+    offset = dset.id.get_offset()
+    if not mmap or offset is None or dset.chunks is not None:
+        return dset[()]
+
+    # copy-on-write, changes are never written back to the file
+    return np.memmap(path, dtype=dset.dtype, mode="c", offset=offset, shape=dset.shape)
+
+
+def load_columnar(path: Path, mmap: bool = True) -> ColumnarProduct:
+    """Function to load a columnar product from a HDF5 file
+
+    Args:
+        path: path of the .h5 file
+        mmap: if the numeric columns should be memory-mapped
+
+    Returns:
+        the columnar product
+    """
+    path = Path(path)
+    columns, kinds, present, shapes = {}, {}, {}, {}
+
+    with h5py.File(path, "r") as fh:
+        time = _read(path, fh["time"], mmap).view("datetime64[us]")
+        for name, dset in fh["columns"].items():
+            kind = dset.attrs["kind"]
+            column = _read(path, dset, mmap)
+            if kind in ("str", "path"):
+                column = np.char.decode(column, "utf-8")
+            elif kind == "timedelta":
+                column = column.view("timedelta64[us]")
+
+            columns[name] = column
+            kinds[name] = kind
+
+        for name, dset in fh.get("present", {}).items():
+            present[name] = dset[()]
+        for name, dset in fh.get("shapes", {}).items():
+            shapes[name] = dset[()]
+
+    return ColumnarProduct(
+        time=time, columns=columns, kinds=kinds, present=present, shapes=shapes
+    )
+
+
+class LazyProduct:
+    """Product in a columnar HDF5 file read on demand
+
+    Only the time index is read when opened, a profile or a
+    column is read from the file when it is accessed. Use it
+    for products written with save_columnar(chunked=True), such
+    as the MIRA2 spectra, where most of the file is seldom needed
+    """
+
+    def __init__(self, path: Path):
+        """Init constructor
+
+        Args:
+            path: path of the .h5 file
+        """
+        self.path = Path(path)
+        self.fh = h5py.File(self.path, "r")
+        self.time = self.fh["time"][()].view("datetime64[us]")
+        self.present = {k: v[()] for k, v in self.fh.get("present", {}).items()}
+        self.shapes = {k: v[()] for k, v in self.fh.get("shapes", {}).items()}
+
+    def __enter__(self) -> "LazyProduct":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def __contains__(self, key: datetime) -> bool:
+        return self._index(key) is not None
+
+    def _index(self, key: datetime):
+        key = np.datetime64(key, "us")
+        i = np.searchsorted(self.time, key)
+        if i < len(self.time) and self.time[i] == key:
+            return int(i)
+        return None
+
+    def close(self):
+        self.fh.close()
+
+    def keys(self) -> list:
+        return list(self.time.astype(datetime))
+
+    def fields(self) -> list:
+        return list(self.fh["columns"].keys())
+
+    def column(self, name: str) -> NDArray:
+        """Method to read one field for all profiles
+
+        Args:
+            name: name of the field
+
+        Returns:
+            the column of the field, padded as in ColumnarProduct
+        """
+        dset = self.fh["columns"][name]
+        column = dset[()]
+        match dset.attrs["kind"]:
+            case "str" | "path":
+                column = np.char.decode(column, "utf-8")
+            case "timedelta":
+                column = column.view("timedelta64[us]")
+        return column
+
+    def __getitem__(self, key: datetime) -> dict:
+        """Method to read the fields of one profile
+
+        Args:
+            key: datetime of the profile
+
+        Returns:
+            dictionary with the fields of the profile
+        """
+        i = self._index(key)
+        if i is None:
+            raise KeyError(key)
+
+        record = {}
+        for name, dset in self.fh["columns"].items():
+            if name in self.present and not self.present[name][i]:
+                continue
+
+            kind = dset.attrs["kind"]
+            value = dset[i]
+            if kind in ("str", "path"):
+                value = np.char.decode(value, "utf-8")
+            elif kind == "timedelta":
+                value = np.asarray(value).view("timedelta64[us]")
+            if name in self.shapes:
+                value = value[tuple(slice(0, n) for n in self.shapes[name][i])]
+            record[name] = _decode(value, kind)
+        return record
+
+
+def product_path(path: Path, store: str) -> Path:
+    """Function to get the path of a product in a store
+
+    Args:
+        path: path of the product without suffix
+        store: one of STORES
+
+    Returns:
+        path of the product with the suffix of the store
+    """
+    assert store in STORES, f"Store must be one of {STORES}"
+    path = Path(path)
+    return path.parent / f"{path.name}.{store}"
+
+
+def save_product(path: Path, data: dict, store: str = "npy") -> Path:
+    """Function to save a product
+
+    Args:
+        path: path of the product without suffix
+        data: dictionary with the profiles keyed by datetime
+        store: 'npy' for a pickled dictionary, or 'h5' for a
+            columnar HDF5 file
+
+    Returns:
+        path of the saved product
+    """
+    savepath = product_path(path, store)
+    match store:
+        case "npy":
+            np.save(savepath, data, allow_pickle=True)
+        case "h5":
+            save_columnar(savepath, to_columns(data))
+    return savepath
+
+
+def load_product(path: Path) -> dict:
+    """Function to load a product as a dictionary
+
+    Reads both pickled .npy products and columnar .h5 products
+
+    Args:
+        path: path of the product
+
+    Returns:
+        dictionary with the profiles keyed by datetime
+    """
+    path = Path(path)
+    if path.suffix == ".h5":
+        return load_columnar(path).to_dict()
+    return np.load(path, allow_pickle=True).item()
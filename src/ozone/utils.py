@@ -5,6 +5,9 @@ from dataclasses import dataclass, fields, field
 from .io import get_datadir
 from datetime import date
 from numpy.typing import NDArray
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator
 
 
 @dataclass
@@ -59,6 +62,39 @@ def find_downloads() -> Path:
     return downloadsdir
 
 
+def map_ordered(func: Callable, items: Iterable, workers: int = 1) -> Iterator:
+    """Function to map a function over items, optionally in parallel
+
+    The items are processed serially, or by a pool of worker processes
+    if workers > 1. The results are always yielded in the same order
+    as the items, and at most two items per worker are in flight so
+    the memory use stays bounded. func must be picklable, i.e. a module
+    level function or a functools.partial of one
+
+    Args:
+        func: function called with each item
+        items: items to process
+        workers: number of worker processes
+
+    Returns:
+        iterator with the results
+    """
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
 def fill_nans(mdict: dict) -> dict:
     """Function to fill NaN's if date is missing
 